@@ -0,0 +1,98 @@
+import os
+import re
+import sys
+import argparse
+import tempfile
+import subprocess
+
+# The characters of sed's [[:space:]]
+WHITESPACE = b" \t\n\r\f\v"
+
+def normalize(data):
+    # Same result as tester.sh's former preprocess_file pipeline as seen through
+    # $(...). Its sed drops the leading blank lines and joins the rest, turns the
+    # first newline into a NUL, strips trailing whitespace from the joined text and
+    # turns NULs back into newlines. So the first line keeps its trailing blanks
+    # when everything after it is blank, and, like sed's N on the last line, so
+    # does a single remaining line.
+    lines = data.split(b"\n")
+    if data.endswith(b"\n"):
+        lines.pop()
+    while lines and not lines[0].strip(WHITESPACE):
+        lines.pop(0)
+    if len(lines) == 1:
+        return lines[0]
+    joined = b"\n".join(lines).replace(b"\n", b"\0", 1).rstrip(WHITESPACE)
+    return joined.replace(b"\0", b"\n").rstrip(b"\n")
+
+def normalize_loose(data):
+    # Same result as the SubmissionTests preprocess_file pipeline: decoded to
+    # UTF-8, then every line with its whitespace runs collapsed to one space and
+    # trimmed, and blank lines dropped
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip(" ") for line in text.split("\n"))
+    return "\n".join(line for line in lines if line).encode("utf-8")
+
+def read_normalized(path, loose):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return normalize_loose(data) if loose else normalize(data)
+
+def text_diff(expected, output):
+    # The normal-format diff tester.sh used to write, i.e. diff <(echo "$EXPECTED") <(echo "$OUTPUT")
+    with tempfile.NamedTemporaryFile() as expected_file, tempfile.NamedTemporaryFile() as output_file:
+        expected_file.write(expected + b"\n")
+        output_file.write(output + b"\n")
+        expected_file.flush()
+        output_file.flush()
+        result = subprocess.run(["diff", expected_file.name, output_file.name], stdout=subprocess.PIPE)
+    return result.stdout.rstrip(b"\n")
+
+def compare_dirs(output_dir, expected_dir, fail_dir, loose=False):
+    # Compare every expected file with the file of the same name in output_dir by
+    # their normalized contents. In strict mode a diff is computed only
+    # for mismatching files and saved as fail_dir/diff_<name>.txt, and files missing
+    # from output_dir are left to check_missing_files. In loose mode (the
+    # SubmissionTests tester) a missing file is a mismatch and the first mismatch
+    # ends the comparison. Returns True if everything matched.
+    all_match = True
+    for name in sorted(os.listdir(expected_dir)):
+        expected_path = os.path.join(expected_dir, name)
+        output_path = os.path.join(output_dir, name)
+        if name.startswith(".") or not os.path.isfile(expected_path):
+            continue
+        if not os.path.isfile(output_path):
+            if loose:
+                return False
+            continue
+
+        expected = read_normalized(expected_path, loose)
+        output = read_normalized(output_path, loose)
+        if expected == output:
+            continue
+        if loose:
+            return False
+
+        all_match = False
+        os.makedirs(fail_dir, exist_ok=True)
+        with open(os.path.join(fail_dir, f"diff_{name}.txt"), 'wb') as file:
+            file.write(text_diff(expected, output) + b"\n")
+    return all_match
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a directory of outputs with the expected files, ignoring blank lines and trailing whitespace.")
+    parser.add_argument("output_dir")
+    parser.add_argument("expected_dir")
+    parser.add_argument("--fail-dir", help="where diff_<name>.txt files go (default: fails/test_<basename of output_dir>)")
+    parser.add_argument("--loose", action="store_true",
+                        help="also ignore encoding and runs of whitespace, and stop at the first mismatch or missing file")
+    args = parser.parse_args()
+
+    fail_dir = args.fail_dir or os.path.join("fails", f"test_{os.path.basename(os.path.normpath(args.output_dir))}")
+    sys.exit(0 if compare_dirs(args.output_dir, args.expected_dir, fail_dir, args.loose) else 1)
+
+if __name__ == "__main__":
+    main()
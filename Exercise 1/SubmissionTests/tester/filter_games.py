@@ -1,51 +1,54 @@
 import os
-import sys
+import argparse
 import chess.pgn
-import io
+from concurrent.futures import ProcessPoolExecutor
+
+# Files handed to a pool worker at a time
+POOL_CHUNK_SIZE = 16
 
 def contains_en_passant_or_castling(file_path):
     with open(file_path, 'r') as file:
-        pgn = file.read()
-    
-    pgn_io = io.StringIO(pgn)
-    game = chess.pgn.read_game(pgn_io)
+        game = chess.pgn.read_game(file)
 
     if game is None:
         return False
 
+    # Advance one board through the mainline and let the library classify each move
+    board = game.board()
     for move in game.mainline_moves():
-        uci_move = move.uci()
-        # Check for castling moves
-        if uci_move in ["e1g1", "e1c1", "e8g8", "e8c8"]:
-            return True
-        # Check for en passant moves
-        from_square = chess.parse_square(uci_move[:2])
-        to_square = chess.parse_square(uci_move[2:4])
-        piece = game.board().piece_at(from_square)
-        if piece and piece.piece_type == chess.PAWN and abs(chess.square_file(from_square) - chess.square_file(to_square)) == 1 and game.board().piece_at(to_square) is None:
+        if board.is_castling(move) or board.is_en_passant(move):
             return True
+        board.push(move)
     return False
 
-def delete_files_with_en_passant_or_castling(folder_path):
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith('.pgn'):
-            file_path = os.path.join(folder_path, file_name)
-            if contains_en_passant_or_castling(file_path):
+def delete_files_with_en_passant_or_castling(folder_path, dry_run=False, workers=None):
+    file_names = sorted(file_name for file_name in os.listdir(folder_path) if file_name.endswith('.pgn'))
+    file_paths = [os.path.join(folder_path, file_name) for file_name in file_names]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        matches = executor.map(contains_en_passant_or_castling, file_paths, chunksize=POOL_CHUNK_SIZE)
+        for file_name, file_path, matched in zip(file_names, file_paths, matches):
+            if not matched:
+                continue
+            if dry_run:
+                print(f"Would delete {file_name}")
+            else:
                 os.remove(file_path)
                 print(f"Deleted {file_name}")
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python delete_pgn_files.py <FOLDER_PATH>")
-        return
-    
-    folder_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Delete the PGN files of games that contain castling or en passant.")
+    parser.add_argument("folder_path", help="folder with one game per .pgn file")
+    parser.add_argument("--dry-run", action="store_true", help="list the matching files instead of deleting them")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    args = parser.parse_args()
 
-    if not os.path.isdir(folder_path):
-        print(f"The path {folder_path} is not a directory.")
+    if not os.path.isdir(args.folder_path):
+        print(f"The path {args.folder_path} is not a directory.")
         return
-    
-    delete_files_with_en_passant_or_castling(folder_path)
+
+    delete_files_with_en_passant_or_castling(args.folder_path, args.dry_run, args.workers)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import csv
+import time
+import hashlib
+import tempfile
+import argparse
+import subprocess
+
+# Columns of the per-test resource log
+RESOURCE_COLUMNS = ["test", "exit_code", "wall_s", "user_s", "sys_s", "max_rss_kb"]
+
+# The compiled wrapper below is kept in COMPILE_CACHE_DIR, or in
+# ~/.cache/os-exercises/compile, so it is built once rather than on every run
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "os-exercises", "compile")
+
+# Linux carries a process's peak RSS across exec, so a command started straight
+# from this script never reports a max_rss_kb below the interpreter's (~12 MB).
+# Commands are therefore started through this wrapper: once exec'd its address
+# space is tiny, and it forks and execs the command, waits for it and writes the
+# command's own ru_maxrss (in KB) to the report file. Same program as in
+# Exercise 2's measure.py.
+WRAPPER_SOURCE = r"""
+#include <errno.h>
+#include <stdio.h>
+#include <signal.h>
+#include <unistd.h>
+#include <sys/wait.h>
+#include <sys/resource.h>
+
+int main(int argc, char *argv[]) {
+    if (argc < 3) {
+        fprintf(stderr, "usage: %s REPORT COMMAND [ARG]...\n", argv[0]);
+        return 127;
+    }
+    pid_t pid = fork();
+    if (pid < 0) {
+        perror("fork");
+        return 127;
+    }
+    if (pid == 0) {
+        execvp(argv[2], argv + 2);
+        perror(argv[2]);
+        _exit(127);
+    }
+
+    int status;
+    struct rusage usage;
+    while (wait4(pid, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return 127;
+        }
+    }
+    FILE *report = fopen(argv[1], "w");
+    if (report) {
+        fprintf(report, "%ld\n", usage.ru_maxrss);
+        fclose(report);
+    }
+
+    // Exit the way the command did, so the caller sees the same status
+    if (WIFSIGNALED(status)) {
+        signal(WTERMSIG(status), SIG_DFL);
+        raise(WTERMSIG(status));
+        return 128 + WTERMSIG(status);
+    }
+    return WEXITSTATUS(status);
+}
+"""
+
+def rusage_wrapper():
+    # Path of the compiled wrapper, built into the cache directory the first time;
+    # None if it cannot be built (then max_rss_kb includes this script's RSS)
+    cache_dir = os.environ.get("COMPILE_CACHE_DIR", DEFAULT_CACHE_DIR)
+    digest = hashlib.sha256(WRAPPER_SOURCE.encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"rusage_wrapper-{digest}")
+    if os.access(path, os.X_OK):
+        return path
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp = tempfile.mkstemp(prefix="rusage_wrapper.", suffix=".tmp", dir=cache_dir)
+        os.close(fd)
+        try:
+            result = subprocess.run(["gcc", "-O2", "-x", "c", "-", "-o", temp], input=WRAPPER_SOURCE.encode(),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if result.returncode != 0:
+                return None
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.unlink(temp)
+    except OSError:
+        return None
+    return path
+
+def run_measured(command):
+    # Run command with the inherited stdin/stdout/stderr and return its exit code
+    # and resource usage. wait4 reports the CPU time of the process and of every
+    # descendant it waited for; the peak RSS (in KB) is the command's own, measured
+    # through the wrapper above.
+    wrapper = rusage_wrapper()
+    with tempfile.NamedTemporaryFile(prefix="rusage_") as report:
+        start = time.perf_counter()
+        process = subprocess.Popen([wrapper, report.name] + command if wrapper else command)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        max_rss = rusage.ru_maxrss
+        if wrapper:
+            # Left blank if the wrapper was killed before it could report
+            try:
+                max_rss = int(report.read())
+            except ValueError:
+                max_rss = ""
+    return process.returncode, {
+        "wall_s": f"{wall:.3f}",
+        "user_s": f"{rusage.ru_utime:.3f}",
+        "sys_s": f"{rusage.ru_stime:.3f}",
+        "max_rss_kb": max_rss,
+    }
+
+def append_usage(log_file, test, exit_code, usage):
+    # Append one row to the CSV resource log, writing the header to a new log
+    new_log = not os.path.isfile(log_file) or os.path.getsize(log_file) == 0
+    with open(log_file, 'a', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=RESOURCE_COLUMNS)
+        if new_log:
+            writer.writeheader()
+        writer.writerow({"test": test, "exit_code": exit_code, **usage})
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a command and log its wall time, CPU time and peak RSS.")
+    parser.add_argument("--log", required=True, help="CSV file the usage row is appended to")
+    parser.add_argument("--test", required=True, help="name of the test, the first column of the row")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="the command to run, after --")
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("no command given")
+
+    try:
+        returncode, usage = run_measured(command)
+    except OSError as error:
+        print(f"{command[0]}: {error.strerror}", file=sys.stderr)
+        sys.exit(127)
+
+    append_usage(args.log, args.test, returncode, usage)
+    # Exit like a shell reports the command: 128 + N when it was killed by signal N
+    sys.exit(128 - returncode if returncode < 0 else returncode)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,31 @@
 import sys
 import io
+import re
+import argparse
+import chess
 import chess.pgn
 
+# Headers written in front of each line by --tag unless --headers is given
+DEFAULT_TAG_HEADERS = ["White", "Black", "Result"]
+
+# Movetext tokens the mainline extraction looks at. Comments are matched whole so
+# their contents are never tokenized; NAGs, move numbers, annotations and results
+# match nothing and are skipped. The SAN alternatives are the ones chess.pgn accepts.
+MOVETEXT_TOKEN_REGEX = re.compile(r"""
+    \{[^}]*\}?
+    |;[^\n]*
+    |\(
+    |\)
+    |[NBKRQ]?[a-h]?[1-8]?[\-x]?[a-h][1-8](?:=?[nbrqkNBRQK])?
+    |[PNBRQK]?@[a-h][1-8]
+    |--
+    |Z0
+    |0000
+    |@@@@
+    |O-O(?:-O)?
+    |0-0(?:-0)?
+    """, re.VERBOSE)
+
 def normalize_newlines_and_encoding(pgn_input):
     # Normalize newlines
     normalized_pgn = pgn_input.replace('\r\n', '\n').replace('\r', '\n')
@@ -15,37 +39,195 @@ def normalize_newlines_and_encoding(pgn_input):
 
     return normalized_pgn
 
-def parse_moves(pgn_moves):
+def read_game_movetext(pgn_stream):
+    # Split the next game off the stream with the same rules as chess.pgn.read_game,
+    # but keep its movetext as plain text instead of building a game tree.
+    # Returns (headers, movetext), or None at the end of the stream.
+    line = pgn_stream.readline().lstrip("\ufeff")
+    while line.isspace() or line.startswith("%") or line.startswith(";"):
+        line = pgn_stream.readline()
+    if not line:
+        return None
+
+    # Parse game headers, ignoring comments and up to one empty line between them
+    headers = chess.pgn.Headers()
+    consecutive_empty_lines = 0
+    while line:
+        if line.startswith("%") or line.startswith(";"):
+            line = pgn_stream.readline()
+            continue
+        if consecutive_empty_lines < 1 and line.isspace():
+            consecutive_empty_lines += 1
+            line = pgn_stream.readline()
+            continue
+        if not line.startswith("["):
+            break
+        consecutive_empty_lines = 0
+        tag_match = chess.pgn.TAG_REGEX.match(line)
+        if tag_match:
+            headers[tag_match.group(1)] = tag_match.group(2)
+        line = pgn_stream.readline()
+
+    # Collect the movetext up to the first empty line outside of a comment
+    movetext_lines = []
+    in_comment = False
+    while line:
+        if not in_comment:
+            if line.isspace():
+                break
+            if line.startswith("%") or line.startswith(";"):
+                line = pgn_stream.readline()
+                continue
+        movetext_lines.append(line)
+        for match in chess.pgn.SKIP_MOVETEXT_REGEX.finditer(line):
+            token = match.group(0)
+            if token == "{":
+                in_comment = True
+            elif not in_comment and token == ";":
+                break
+            elif token == "}":
+                in_comment = False
+        line = pgn_stream.readline()
+
+    return headers, ''.join(movetext_lines)
+
+def starting_board(headers):
+    # The initial position chess.pgn.read_game would use, or None if the FEN header is invalid
+    try:
+        VariantBoard = headers.variant()
+    except ValueError:
+        VariantBoard = chess.Board
+    try:
+        board = VariantBoard(headers.get("FEN", VariantBoard.starting_fen), chess960=headers.is_chess960())
+    except ValueError:
+        return None
+    board.chess960 = board.chess960 or board.has_chess960_castling_rights()
+    return board
+
+def movetext_uci_moves(movetext, board):
+    # Convert the mainline SAN moves to UCI against a single board. Comments and
+    # whole variations are skipped without parsing any of the moves inside them.
+    uci_moves = []
+    variation_depth = 0
+    for match in MOVETEXT_TOKEN_REGEX.finditer(movetext):
+        token = match.group(0)
+        if token == "(":
+            if variation_depth or board.move_stack:
+                variation_depth += 1
+        elif token == ")":
+            if variation_depth:
+                variation_depth -= 1
+        elif variation_depth or token[0] in "{;":
+            continue
+        else:
+            try:
+                move = board.parse_san(token)
+            except ValueError:
+                # Like chess.pgn, drop the rest of the mainline after an illegal move
+                break
+            uci_moves.append(move.uci())
+            board.push(move)
+
+    return uci_moves
+
+def game_uci_moves(headers, movetext):
+    board = starting_board(headers)
+    if board is None:
+        return []
+    return movetext_uci_moves(movetext, board)
+
+def parse_moves(pgn_moves, err=sys.stderr):
     # Normalize the input PGN string
     normalized_pgn = normalize_newlines_and_encoding(pgn_moves)
 
     # Read the game from the normalized PGN string
     pgn_stream = io.StringIO(normalized_pgn)
-    game = chess.pgn.read_game(pgn_stream)
-    
+    game = read_game_movetext(pgn_stream)
+
     if not game:
-        print("Failed to parse PGN", file=sys.stderr)
+        print("Failed to parse PGN", file=err)
         return []
 
-    # Traverse the game to collect UCI moves
-    node = game
-    uci_moves = []
-    while node.variations:
-        next_node = node.variation(0)
-        uci_moves.append(next_node.move.uci())
-        node = next_node
+    return game_uci_moves(*game)
 
-    return uci_moves
+def convert_games(pgn_stream, out, tag=False, headers=DEFAULT_TAG_HEADERS, first=1, limit=None):
+    # Write one line of UCI moves per game in the stream, optionally prefixed
+    # with the 1-based game index (counting from `first`) and the given headers,
+    # separated by tabs. Stops after `limit` games if given.
+    count = 0
+    while limit is None or count < limit:
+        game = read_game_movetext(pgn_stream)
+        if game is None:
+            break
+        game_headers, movetext = game
+        line = ' '.join(game_uci_moves(game_headers, movetext))
+        if tag:
+            fields = [str(first + count)] + [game_headers.get(header, "?") for header in headers]
+            line = '\t'.join(fields + [line])
+        out.write(line + '\n')
+        count += 1
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py '<pgn_moves>'", file=sys.stderr)
-        sys.exit(1)
+    return count
+
+def convert_game(pgn_file, game_number, out, tag=False, headers=DEFAULT_TAG_HEADERS, use_index=False):
+    # Convert only the 1-based game_number of the file. With use_index the game's
+    # bytes are sliced out of a memory map of the file at the offset recorded in
+    # the sidecar index (see pgn_index.py) instead of skipping the games before it.
+    if use_index:
+        # Imported here so this script still runs on its own when it is copied around
+        import pgn_index
+        game_text = pgn_index.read_game_text(pgn_file, game_number)
+        if game_text is None:
+            return 0
+        return convert_games(io.StringIO(game_text), out, tag, headers, game_number, 1)
+
+    with open(pgn_file, 'r') as pgn_stream:
+        for _ in range(game_number - 1):
+            if not chess.pgn.skip_game(pgn_stream):
+                return 0
+        return convert_games(pgn_stream, out, tag, headers, game_number, 1)
+
+def print_uci_moves(pgn_moves, out=sys.stdout, err=sys.stderr):
+    uci_moves = parse_moves(pgn_moves, err)
 
-    pgn_moves = sys.argv[1]
-    uci_moves = parse_moves(pgn_moves)
-    
     if uci_moves:
-        print(' '.join(uci_moves))
+        print(' '.join(uci_moves), file=out)
     else:
-        print("No valid moves found.", file=sys.stderr)
+        print("No valid moves found.", file=err)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert PGN moves to UCI moves.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("pgn_moves", nargs="?", help="PGN moves of a single game")
+    source.add_argument("--file", help="convert every game of a PGN file ('-' for stdin), one line per game")
+    parser.add_argument("--tag", action="store_true",
+                        help="prefix each line with the game index and headers (with --file)")
+    parser.add_argument("--headers", default=','.join(DEFAULT_TAG_HEADERS),
+                        help=f"comma separated headers written by --tag (default: {','.join(DEFAULT_TAG_HEADERS)})")
+    parser.add_argument("--game", type=int, help="convert only this 1-based game of the file (with --file)")
+    parser.add_argument("--index", action="store_true",
+                        help="find --game through the byte-offset index next to the file, building it if needed")
+    args = parser.parse_args()
+    if args.game is not None and (args.file is None or args.file == '-'):
+        parser.error("--game requires --file with a file path")
+    if args.game is not None and args.game < 1:
+        parser.error("--game must be at least 1")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.file is not None:
+        headers = [header for header in args.headers.split(',') if header]
+        if args.game is not None:
+            if not convert_game(args.file, args.game, sys.stdout, args.tag, headers, args.index):
+                print(f"Game {args.game} not found in {args.file}.", file=sys.stderr)
+                sys.exit(1)
+        elif args.file == '-':
+            convert_games(sys.stdin, sys.stdout, args.tag, headers)
+        else:
+            with open(args.file, 'r') as pgn_file:
+                convert_games(pgn_file, sys.stdout, args.tag, headers)
+        sys.exit(0)
+
+    print_uci_moves(args.pgn_moves)
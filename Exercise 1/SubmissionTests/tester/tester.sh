@@ -41,28 +41,20 @@ check_missing_files() {
     return 0
 }
 
-preprocess_file() {
-    local FILE=$1
-    iconv -f "$(file -bi "$FILE" | sed -e 's/.*[ ]charset=//')" -t UTF-8 "$FILE" | sed -e 's/\r$//' -e '/^[[:space:]]*$/d' -e 's/[[:space:]]\+/ /g' -e 's/[[:space:]]*$//' -e 's/^[[:space:]]*//' | sed -e '$a\'
+# Run a student command through measure.py, which appends its wall time, CPU time
+# and peak RSS to the resource log as a row named after the test
+measure() {
+    local TEST_NAME=$1
+    shift
+    python3 "$CURRENT_DIR/measure.py" --log "$RESOURCES_FILE" --test "$TEST_NAME" -- "$@"
 }
 
+# Normalizes each file (encoding, blank lines and runs of whitespace are ignored) and
+# fails on the first expected file that is missing or differs
 compare_file_contents() {
     local OUTPUT_DIR=$1
     local EXPECTED_OUTPUT_DIR=$2
-    for EXPECTED_FILE in "$EXPECTED_OUTPUT_DIR"/*; do
-        FILE_NAME=$(basename "$EXPECTED_FILE")
-        if [[ -f "$OUTPUT_DIR/$FILE_NAME" ]]; then
-            EXPECTED_CONTENT=$(preprocess_file "$EXPECTED_FILE")
-            OUTPUT_CONTENT=$(preprocess_file "$OUTPUT_DIR/$FILE_NAME")
-            DIFF=$(diff <(echo "$EXPECTED_CONTENT") <(echo "$OUTPUT_CONTENT"))
-            if [[ -n "$DIFF" ]]; then
-                return 1
-            fi
-        else
-            return 1
-        fi
-    done
-    return 0
+    python3 "$CURRENT_DIR/compare_outputs.py" --loose "$OUTPUT_DIR" "$EXPECTED_OUTPUT_DIR"
 }
 
 run_part_1_tests() {
@@ -93,7 +85,7 @@ run_part_1_tests() {
 
         mkdir -p "$OUTPUT_DIR"
 
-        if ! ./"$SPLIT_SCRIPT" "$INPUT" "$OUTPUT_DIR" > /dev/null 2>&1; then
+        if ! measure "part_1:$INPUT" ./"$SPLIT_SCRIPT" "$INPUT" "$OUTPUT_DIR" > /dev/null 2>&1; then
             log_result "FAILED"
             continue
         fi
@@ -149,6 +141,7 @@ run_part_2_tests() {
 
     for TEST in $PART_2_TESTS; do
         ((TEST_NUM++))
+        TEST_NAME="part_2:$TEST_NUM"
         INPUT_PATH_PGN=$(echo "$TEST" | jq -r '.input_path_pgn')
         MOVES=$(echo "$TEST" | jq -r '.moves')
 
@@ -156,8 +149,8 @@ run_part_2_tests() {
 
         MOVES_WITH_ENTER=$(echo "$MOVES" | sed 's/./&\n/g')
 
-        echo -e "$MOVES_WITH_ENTER" | ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
-        echo -e "$MOVES_WITH_ENTER" | python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" > "$TEMP_DIR/expected_output.txt" 2>&1
+        echo -e "$MOVES_WITH_ENTER" | measure "$TEST_NAME" ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
+        python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" --keys="$MOVES" > "$TEMP_DIR/expected_output.txt" 2>&1
 
         DIFF=$(diff -u "$TEMP_DIR/student_output.txt" "$TEMP_DIR/expected_output.txt")
 
@@ -212,6 +205,7 @@ run_part_2_special_tests() {
 
     for TEST in $PART_2_SPECIAL_TESTS; do
         ((TEST_NUM++))
+        TEST_NAME="part_2_special:$TEST_NUM"
         INPUT_PATH_PGN=$(echo "$TEST" | jq -r '.input_path_pgn')
         MOVES=$(echo "$TEST" | jq -r '.moves')
 
@@ -219,8 +213,8 @@ run_part_2_special_tests() {
 
         MOVES_WITH_ENTER=$(echo "$MOVES" | sed 's/./&\n/g')
 
-        echo -e "$MOVES_WITH_ENTER" | ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
-        echo -e "$MOVES_WITH_ENTER" | python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" > "$TEMP_DIR/expected_output.txt" 2>&1
+        echo -e "$MOVES_WITH_ENTER" | measure "$TEST_NAME" ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
+        python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" --keys="$MOVES" > "$TEMP_DIR/expected_output.txt" 2>&1
 
         DIFF=$(diff -u "$TEMP_DIR/student_output.txt" "$TEMP_DIR/expected_output.txt")
 
@@ -250,6 +244,10 @@ run_part_2_special_tests() {
 
 CURRENT_DIR=$(pwd)
 
+# Per-test resource usage of the student's scripts, see measure()
+RESOURCES_FILE="$CURRENT_DIR/resources.csv"
+rm -f "$RESOURCES_FILE"
+
 PART_1_TESTS=$(jq -c '.part_1[]' "$CONFIG_FILE")
 PART_2_TESTS=$(jq -c '.part_2[]' "$CONFIG_FILE")
 PART_2_SPECIAL_TESTS=$(jq -c '.part_2_special[]' "$CONFIG_FILE")
@@ -0,0 +1,62 @@
+import os
+import random
+import subprocess
+import sys
+import time
+import argparse
+
+EXERCISE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHESS_SIM = os.path.join(EXERCISE_DIR, "chess_sim.py")
+DEFAULT_PGN = os.path.join(EXERCISE_DIR, "tester", "splited_pgns", "Alburt", "Alburt_700.pgn")
+
+def make_key_script(length, seed):
+    # Random navigation keys with the occasional invalid key, ending with 'q'
+    rng = random.Random(seed)
+    return ''.join(rng.choice("ddddaawsx") for _ in range(length)) + 'q'
+
+def run_interactive(pgn_file, keys):
+    stdin = ''.join(f"{key}\n" for key in keys)
+    return subprocess.run([sys.executable, CHESS_SIM, pgn_file], input=stdin,
+                          capture_output=True, text=True, check=True).stdout
+
+def run_keys(pgn_file, keys):
+    return subprocess.run([sys.executable, CHESS_SIM, pgn_file, f"--keys={keys}"],
+                          capture_output=True, text=True, check=True).stdout
+
+def run_batch(pgn_file, keys):
+    stdin = ''.join(f"{key}\n" for key in keys)
+    return subprocess.run([sys.executable, CHESS_SIM, pgn_file, "--batch"], input=stdin,
+                          capture_output=True, text=True, check=True).stdout
+
+def benchmark(name, runner, pgn_file, keys, repeat):
+    best = None
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = runner(pgn_file, keys)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<12} {best:8.3f} s  {len(keys) / best:12.0f} keys/s")
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description="Keystrokes per second of chess_sim.py in interactive and batch mode.")
+    parser.add_argument("pgn_file", nargs="?", default=DEFAULT_PGN)
+    parser.add_argument("--keys", type=int, default=5000, help="number of key presses in the script (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, the best one is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    keys = make_key_script(args.keys, args.seed)
+    print(f"{len(keys)} keys against {args.pgn_file}")
+    interactive = benchmark("interactive", run_interactive, args.pgn_file, keys, args.repeat)
+    batch = benchmark("--batch", run_batch, args.pgn_file, keys, args.repeat)
+    scripted = benchmark("--keys", run_keys, args.pgn_file, keys, args.repeat)
+
+    if batch != interactive or scripted != interactive:
+        print("Batch output differs from interactive output!")
+        sys.exit(1)
+    print("Batch output is byte-identical to interactive output.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import glob
+import time
+import argparse
+
+import chess.pgn
+
+EXERCISE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXERCISE_DIR)
+
+import parse_moves
+
+DEFAULT_PGNS = sorted(glob.glob(os.path.join(EXERCISE_DIR, "tester", "pgns", "*.pgn")) +
+                      glob.glob(os.path.join(EXERCISE_DIR, "SubmissionTests", "tester", "pgns", "*.pgn")))
+
+def tree_uci_lines(pgn_file):
+    # The previous approach: build the full GameNode tree and walk its mainline
+    lines = []
+    with open(pgn_file, 'r') as pgn_stream:
+        while True:
+            game = chess.pgn.read_game(pgn_stream)
+            if game is None:
+                break
+            node = game
+            uci_moves = []
+            while node.variations:
+                node = node.variation(0)
+                uci_moves.append(node.move.uci())
+            lines.append(' '.join(uci_moves))
+    return lines
+
+def movetext_uci_lines(pgn_file):
+    lines = []
+    with open(pgn_file, 'r') as pgn_stream:
+        while True:
+            game = parse_moves.read_game_movetext(pgn_stream)
+            if game is None:
+                break
+            lines.append(' '.join(parse_moves.game_uci_moves(*game)))
+    return lines
+
+def timed(converter, pgn_file, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lines = converter(pgn_file)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return lines, best
+
+def main():
+    parser = argparse.ArgumentParser(description="Game tree vs. mainline-only SAN to UCI conversion.")
+    parser.add_argument("pgn_files", nargs="*", default=DEFAULT_PGNS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per converter, the best one is reported (default: 3)")
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'file':<20} {'games':>6} {'tree games/s':>14} {'mainline games/s':>18} {'speedup':>8}")
+    for pgn_file in args.pgn_files:
+        tree_lines, tree_time = timed(tree_uci_lines, pgn_file, args.repeat)
+        fast_lines, fast_time = timed(movetext_uci_lines, pgn_file, args.repeat)
+        if fast_lines != tree_lines:
+            mismatches += 1
+        games = len(tree_lines)
+        print(f"{os.path.basename(pgn_file):<20} {games:>6} {games / tree_time:>14.0f} "
+              f"{games / fast_time:>18.0f} {tree_time / fast_time:>7.1f}x")
+
+    if mismatches:
+        print(f"{mismatches} file(s) converted differently by the two paths!")
+        sys.exit(1)
+    print("Both paths produce the same UCI moves.")
+
+if __name__ == "__main__":
+    main()
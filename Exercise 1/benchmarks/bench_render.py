@@ -0,0 +1,72 @@
+import os
+import sys
+import io
+import timeit
+import argparse
+
+import chess
+
+EXERCISE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXERCISE_DIR)
+
+import chess_sim
+
+DEFAULT_PGN = os.path.join(EXERCISE_DIR, "tester", "splited_pgns", "Alburt", "Alburt_700.pgn")
+
+def legacy_print_board(board, current_move, total_moves, out):
+    # The renderer print_board used before render_grid
+    print(f"\nMove {current_move}/{total_moves}", file=out)
+    print("  a b c d e f g h", file=out)
+    for rank in range(8, 0, -1):
+        row = f"{rank} "
+        for file in range(1, 9):
+            piece = board.piece_at(chess.square(file - 1, rank - 1))
+            row += f"{piece.symbol() if piece else '.'} "
+        row += f"{rank}"
+        print(row, file=out)
+    print("  a b c d e f g h", file=out)
+
+def game_positions(moves):
+    # Boards for every position of the game, navigated forward and back again
+    boards = [chess.Board()]
+    for move in moves:
+        board = boards[-1].copy(stack=False)
+        board.push_uci(move)
+        boards.append(board)
+    return boards + boards[::-1]
+
+def render_all(renderer, boards):
+    out = io.StringIO()
+    for move_number, board in enumerate(boards):
+        renderer(board, move_number, len(boards), out)
+    return out.getvalue()
+
+def render_all_cold(boards):
+    chess_sim._rendered_grids.clear()
+    return render_all(chess_sim.print_board, boards)
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark of print_board against the previous renderer.")
+    parser.add_argument("pgn_file", nargs="?", default=DEFAULT_PGN)
+    parser.add_argument("--number", type=int, default=50, help="timing loops per renderer (default: 50)")
+    args = parser.parse_args()
+
+    _, moves = chess_sim.extract_pgn_data(args.pgn_file)
+    boards = game_positions(moves)
+
+    if render_all(legacy_print_board, boards) != render_all_cold(boards):
+        print("Rendered boards differ from the previous renderer!")
+        sys.exit(1)
+
+    timings = {
+        "legacy": timeit.timeit(lambda: render_all(legacy_print_board, boards), number=args.number),
+        "cold cache": timeit.timeit(lambda: render_all_cold(boards), number=args.number),
+        "warm cache": timeit.timeit(lambda: render_all(chess_sim.print_board, boards), number=args.number),
+    }
+    renders = len(boards) * args.number
+    print(f"{len(boards)} boards rendered {args.number} times")
+    for name, elapsed in timings.items():
+        print(f"{name:<12} {elapsed / renders * 1e6:8.2f} us/board  {timings['legacy'] / elapsed:6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+EXERCISE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXERCISE_DIR)
+
+import split_pgn
+
+DEFAULT_PGN = os.path.join(EXERCISE_DIR, "tester", "pgns", "Alburt.pgn")
+DEFAULT_EXPECTED = os.path.join(EXERCISE_DIR, "tester", "splited_pgns", "Alburt")
+
+def line_by_line_split(input_file, dest_dir):
+    # Baseline: what the shell loops do, one line at a time into the current game file
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    paths = []
+    game = None
+    with open(input_file, 'rb') as source:
+        for line in source:
+            if line.startswith(split_pgn.GAME_START):
+                if game:
+                    game.close()
+                paths.append(os.path.join(dest_dir, f"{name}_{len(paths) + 1}.pgn"))
+                game = open(paths[-1], 'wb')
+            if game:
+                game.write(line)
+    if game:
+        game.close()
+    return paths
+
+def normalize(content):
+    # The comparison tester.sh makes: leading blank lines and trailing whitespace are ignored
+    return re.sub(rb"\A(?:[ \t\r\f\v]*\n)+", b"", content).rstrip()
+
+def check_expected(paths, expected_dir):
+    mismatches = []
+    for path in paths:
+        expected = os.path.join(expected_dir, os.path.basename(path))
+        if not os.path.isfile(expected):
+            continue
+        with open(path, 'rb') as output, open(expected, 'rb') as reference:
+            if normalize(output.read()) != normalize(reference.read()):
+                mismatches.append(os.path.basename(path))
+    return mismatches
+
+def timed(splitter, input_file, repeat):
+    best = None
+    paths = []
+    for _ in range(repeat):
+        dest_dir = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            paths = splitter(input_file, dest_dir)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(dest_dir)
+        best = elapsed if best is None else min(best, elapsed)
+    return len(paths), best
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of split_pgn.py against a line-by-line split.")
+    parser.add_argument("pgn_file", nargs="?", default=DEFAULT_PGN)
+    parser.add_argument("--expected", default=None,
+                        help=f"expected split directory to compare with (default for Alburt.pgn: {DEFAULT_EXPECTED})")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per splitter, the best one is reported (default: 5)")
+    args = parser.parse_args()
+
+    expected_dir = args.expected or (DEFAULT_EXPECTED if args.pgn_file == DEFAULT_PGN else None)
+    if expected_dir:
+        dest_dir = tempfile.mkdtemp()
+        try:
+            mismatches = check_expected(split_pgn.split_pgn(args.pgn_file, dest_dir), expected_dir)
+        finally:
+            shutil.rmtree(dest_dir)
+        if mismatches:
+            print(f"{len(mismatches)} game file(s) differ from {expected_dir}, e.g. {mismatches[0]}")
+            sys.exit(1)
+        print(f"All games match {expected_dir}")
+
+    megabytes = os.path.getsize(args.pgn_file) / 1e6
+    for name, splitter in [("line by line", line_by_line_split), ("mmap", split_pgn.split_pgn)]:
+        games, elapsed = timed(splitter, args.pgn_file, args.repeat)
+        print(f"{name:<13} {games:>6} games {elapsed * 1000:8.1f} ms {megabytes / elapsed:8.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+EXERCISE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXERCISE_DIR)
+
+import chess_client
+
+DEFAULT_PGN = os.path.join(EXERCISE_DIR, "tester", "filtered_games", "Alburt", "Alburt_100.pgn")
+DEFAULT_KEYS = "ssnddq"
+
+def latency(command, requests):
+    # Mean wall time per call, in milliseconds
+    start = time.perf_counter()
+    for _ in range(requests):
+        command()
+    return (time.perf_counter() - start) / requests * 1000
+
+def run(argv):
+    return subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+
+def wait_for_socket(socket_path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if time.monotonic() > deadline:
+            raise RuntimeError("worker did not start")
+        time.sleep(0.05)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request latency of the worker against cold script starts.")
+    parser.add_argument("pgn_file", nargs="?", default=DEFAULT_PGN)
+    parser.add_argument("--keys", default=DEFAULT_KEYS, help=f"key script for the replay requests (default: {DEFAULT_KEYS})")
+    parser.add_argument("--requests", type=int, default=20, help="requests per measurement (default: 20)")
+    args = parser.parse_args()
+
+    with open(args.pgn_file, 'r') as pgn_file:
+        pgn = pgn_file.read()
+    python = sys.executable
+    parse_script = os.path.join(EXERCISE_DIR, "parse_moves.py")
+    sim_script = os.path.join(EXERCISE_DIR, "chess_sim.py")
+    client_script = os.path.join(EXERCISE_DIR, "chess_client.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "worker.sock")
+        worker = subprocess.Popen([python, os.path.join(EXERCISE_DIR, "chess_worker.py"), "--socket", socket_path],
+                                  stderr=subprocess.DEVNULL)
+        try:
+            wait_for_socket(socket_path)
+            parse_request = {"cmd": "parse_moves", "pgn": pgn}
+            sim_request = {"cmd": "chess_sim", "pgn_file": os.path.abspath(args.pgn_file), "keys": list(args.keys)}
+
+            cold_sim = run([python, sim_script, args.pgn_file, f"--keys={args.keys}"])
+            if chess_client.send_request(socket_path, sim_request)["stdout"] != cold_sim:
+                print("Worker replay output differs from chess_sim.py!")
+                sys.exit(1)
+
+            rows = [
+                ("parse_moves", "cold start", latency(lambda: run([python, parse_script, pgn]), args.requests)),
+                ("parse_moves", "client process", latency(lambda: run([python, client_script, "--socket", socket_path,
+                                                                       "parse_moves", pgn]), args.requests)),
+                ("parse_moves", "socket request", latency(lambda: chess_client.send_request(socket_path, parse_request),
+                                                          args.requests)),
+                ("chess_sim", "cold start", latency(lambda: run([python, sim_script, args.pgn_file, f"--keys={args.keys}"]),
+                                                    args.requests)),
+                ("chess_sim", "client process", latency(lambda: run([python, client_script, "--socket", socket_path,
+                                                                     "chess_sim", args.pgn_file, f"--keys={args.keys}"]),
+                                                        args.requests)),
+                ("chess_sim", "socket request", latency(lambda: chess_client.send_request(socket_path, sim_request),
+                                                        args.requests)),
+            ]
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    print(f"{'request':<12} {'mode':<15} {'ms/request':>10}")
+    for request, mode, milliseconds in rows:
+        print(f"{request:<12} {mode:<15} {milliseconds:>10.2f}")
+
+if __name__ == "__main__":
+    main()
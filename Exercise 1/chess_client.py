@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+
+# Keep in sync with chess_worker.DEFAULT_SOCKET; the client does not import the
+# worker so that it starts without loading python-chess
+SOCKET_DIR = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"chess_worker-{os.getuid()}")
+DEFAULT_SOCKET = os.path.join(SOCKET_DIR, "chess_worker.sock")
+
+def send_request(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            stream.write((json.dumps(request) + "\n").encode())
+            stream.flush()
+            return json.loads(stream.readline())
+
+def run_request(socket_path, request):
+    # Fall back to serving the request in-process when no worker is running
+    try:
+        return send_request(socket_path, request)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import chess_worker
+        return json.loads(chess_worker.handle_request(json.dumps(request)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Thin client for chess_worker.py, a drop-in for the direct script invocations.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"worker socket (default: {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+
+    parse = commands.add_parser("parse_moves", help="same as: python parse_moves.py '<pgn_moves>'")
+    parse.add_argument("pgn_moves")
+
+    replay = commands.add_parser("chess_sim", help="same as: python chess_sim.py <pgn_file> with keys on stdin")
+    replay.add_argument("pgn_file")
+    replay.add_argument("--game", type=int, default=1)
+    replay.add_argument("--keys", help="press each character of KEYS instead of reading one key per line from stdin")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.cmd == "parse_moves":
+        request = {"cmd": "parse_moves", "pgn": args.pgn_moves}
+    else:
+        keys = list(args.keys) if args.keys is not None else sys.stdin.read().splitlines()
+        request = {"cmd": "chess_sim", "pgn_file": args.pgn_file, "cwd": os.getcwd(), "game": args.game, "keys": keys}
+
+    response = run_request(args.socket, request)
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    sys.exit(response["status"])
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,239 @@
 import chess
 import chess.pgn
-import sys
+import argparse
 import io
+import sys
+
+# Size of the chunks the PGN file is read in while streaming games
+READ_CHUNK_SIZE = 64 * 1024
+
+# Number of plies between two cached keyframe positions
+KEYFRAME_INTERVAL = 16
+
+# Maximum number of rendered boards kept by render_grid
+RENDER_CACHE_SIZE = 4096
+
+# Expands the empty-square digits of a FEN board field into one '.' per square
+EXPAND_EMPTY_SQUARES = str.maketrans({str(count): '.' * count for count in range(1, 9)})
+
+PROMPT = "Press 'd' to move forward, 'a' to move back, 'w' to go to the start, 's' to go to the end, 'q' to quit:"
+
+def iter_pgn_games(file_path, start=1):
+    # Stream the games of a PGN file one at a time, reading it in chunks.
+    # Games before `start` are skipped at the tokenizer level, so no game tree is built for them.
+    with open(file_path, 'r', buffering=READ_CHUNK_SIZE) as file:
+        for _ in range(start - 1):
+            if not chess.pgn.skip_game(file):
+                return
+        while True:
+            game = chess.pgn.read_game(file)
+            if game is None:
+                return
+            yield game
+
+def read_indexed_game(file_path, game_number):
+    # Parse only the requested game, sliced out of a memory map of the file at the
+    # offset recorded in the sidecar byte-offset index.
+    # Imported here so chess_sim.py still runs on its own when it is copied around.
+    import pgn_index
+    game_text = pgn_index.read_game_text(file_path, game_number)
+    return None if game_text is None else chess.pgn.read_game(io.StringIO(game_text))
+
+def extract_pgn_data(file_path, game_number=1, use_index=False):
+    if use_index:
+        game = read_indexed_game(file_path, game_number)
+    else:
+        games = iter_pgn_games(file_path, game_number)
+        game = next(games, None)
+        games.close()
+    if game is None:
+        return None, []
 
-def extract_pgn_data(file_path):
-    with open(file_path, 'r') as file:
-        pgn = file.read()
-    
-    pgn_io = io.StringIO(pgn)
-    game = chess.pgn.read_game(pgn_io)
     metadata = game.headers
     moves = [move.uci() for move in game.mainline_moves()]
 
     return metadata, moves
 
-def print_metadata(metadata):
-    print("Metadata from PGN file:")
+def build_keyframes(moves, interval=KEYFRAME_INTERVAL):
+    # Snapshot the position as a FEN string every `interval` plies.
+    # keyframes[k] is the position after k * interval moves.
+    board = chess.Board()
+    keyframes = [board.fen()]
+    for move_number, move in enumerate(moves, start=1):
+        board.push_uci(move)
+        if move_number % interval == 0:
+            keyframes.append(board.fen())
+    return keyframes
+
+def seek(board, keyframes, moves, target, interval=KEYFRAME_INTERVAL):
+    # Put the board in the position after `target` moves by restoring the closest
+    # keyframe at or before it, so at most `interval - 1` moves are replayed.
+    keyframe = target // interval
+    board.set_fen(keyframes[keyframe])
+    for move in moves[keyframe * interval:target]:
+        board.push_uci(move)
+
+def keyframe_cache_size(keyframes):
+    # Memory held by the keyframe cache, in bytes
+    return sys.getsizeof(keyframes) + sum(sys.getsizeof(fen) for fen in keyframes)
+
+def print_cache_stats(keyframes, total_moves, interval):
+    # Reported on stderr so the game output itself is left untouched
+    cache_bytes = keyframe_cache_size(keyframes)
+    per_ply_bytes = cache_bytes * (total_moves + 1) // len(keyframes)
+    print(f"Keyframe cache: {len(keyframes)} positions every {interval} plies for {total_moves} moves, "
+          f"{cache_bytes} bytes (about {per_ply_bytes} bytes with a snapshot per ply)", file=sys.stderr)
+
+def print_metadata(metadata, out=sys.stdout):
+    print("Metadata from PGN file:", file=out)
     for key, value in metadata.items():
-        print(f"[{key} \"{value}\"]")
-
-def print_board(board, current_move, total_moves):
-    print(f"\nMove {current_move}/{total_moves}")
-    print("  a b c d e f g h")
-    for rank in range(8, 0, -1):
-        row = f"{rank} "
-        for file in range(1, 9):
-            piece = board.piece_at(chess.square(file - 1, rank - 1))
-            row += f"{piece.symbol() if piece else '.'} "
-        row += f"{rank}"
-        print(row)
-    print("  a b c d e f g h")
+        print(f"[{key} \"{value}\"]", file=out)
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python chess_game.py <PGN_FILE>")
-        return
+# Rendered grids keyed by piece placement, shared by all print_board calls
+_rendered_grids = {}
+
+def placement_key(board):
+    # The piece bitboards fully describe what print_board shows
+    return (board.occupied_co[chess.WHITE], board.pawns, board.knights, board.bishops,
+            board.rooks, board.queens, board.kings, board.occupied)
+
+def render_grid(board):
+    # Render the 8 board rows in a single pass over the FEN piece placement,
+    # memoized so a position seen before is never rendered again
+    key = placement_key(board)
+    grid = _rendered_grids.get(key)
+    if grid is None:
+        if len(_rendered_grids) >= RENDER_CACHE_SIZE:
+            _rendered_grids.clear()
+        rows = board.board_fen().split('/')
+        grid = ''.join(f"{rank} {' '.join(row.translate(EXPAND_EMPTY_SQUARES))} {rank}\n"
+                       for rank, row in zip(range(8, 0, -1), rows))
+        _rendered_grids[key] = grid
+    return grid
 
-    file_path = sys.argv[1]
-    metadata, moves = extract_pgn_data(file_path)
-    print_metadata(metadata)
+def print_board(board, current_move, total_moves, out=sys.stdout):
+    out.write(f"\nMove {current_move}/{total_moves}\n  a b c d e f g h\n{render_grid(board)}  a b c d e f g h\n")
+
+def interactive_keys():
+    while True:
+        yield input(PROMPT)
+
+def scripted_keys(keys, out):
+    # Write the prompt input() would have shown before each key, including the
+    # one shown when the script runs out, so the output matches interactive mode
+    for key in keys:
+        out.write(PROMPT)
+        yield key
+    out.write(PROMPT)
+
+def replay(metadata, moves, keys, out=sys.stdout, interval=KEYFRAME_INTERVAL, cache_stats=False):
+    print_metadata(metadata, out)
 
     board = chess.Board()
     move_index = 0
     total_moves = len(moves)
+    keyframes = build_keyframes(moves, interval)
 
-    print_board(board, move_index, total_moves)
+    print_board(board, move_index, total_moves, out)
 
-    while True:
-        key = input("Press 'd' to move forward, 'a' to move back, 'w' to go to the start, 's' to go to the end, 'q' to quit:").strip().lower()
+    for key in keys:
+        key = key.strip().lower()
         if key == 'd':
             if move_index < total_moves:
                 board.push_uci(moves[move_index])
                 move_index += 1
-                print_board(board, move_index, total_moves)
+                print_board(board, move_index, total_moves, out)
             else:
-                print()
-                print("No more moves available.")
+                print(file=out)
+                print("No more moves available.", file=out)
         elif key == 'a':
             if move_index > 0:
                 move_index -= 1
-                board.pop()
-                print_board(board, move_index, total_moves)
+                # The move stack only holds the moves replayed since the last jump
+                if board.move_stack:
+                    board.pop()
+                else:
+                    seek(board, keyframes, moves, move_index, interval)
+                print_board(board, move_index, total_moves, out)
             else:
-                print_board(board, move_index, total_moves)
+                print_board(board, move_index, total_moves, out)
         elif key == 'w':
-            while move_index > 0:
-                board.pop()
-                move_index -= 1
-            print_board(board, move_index, total_moves)
+            move_index = 0
+            seek(board, keyframes, moves, move_index, interval)
+            print_board(board, move_index, total_moves, out)
         elif key == 's':
-            while move_index < total_moves:
-                board.push_uci(moves[move_index])
-                move_index += 1
-            print_board(board, move_index, total_moves)
+            move_index = total_moves
+            seek(board, keyframes, moves, move_index, interval)
+            print_board(board, move_index, total_moves, out)
+        elif key.isdecimal():
+            # Go to move N
+            if int(key) <= total_moves:
+                move_index = int(key)
+                seek(board, keyframes, moves, move_index, interval)
+                print_board(board, move_index, total_moves, out)
+            else:
+                print(file=out)
+                print(f"Move {key} is out of range (0-{total_moves}).", file=out)
         elif key == 'q':
-            print()
-            print("Exiting.")
-            print("End of game.")
+            print(file=out)
+            print("Exiting.", file=out)
+            print("End of game.", file=out)
+            if cache_stats:
+                print_cache_stats(keyframes, total_moves, interval)
             break
         else:
-            print()
-            print(f"Invalid key pressed: {key}")
+            print(file=out)
+            print(f"Invalid key pressed: {key}", file=out)
+
+def replay_file(pgn_file, keys, out=sys.stdout, game_number=1, interval=KEYFRAME_INTERVAL, cache_stats=False,
+                use_index=False):
+    metadata, moves = extract_pgn_data(pgn_file, game_number, use_index)
+    if metadata is None:
+        print(f"No game number {game_number} found in {pgn_file}", file=out)
+        return
+    replay(metadata, moves, keys, out, interval, cache_stats)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a chess game from a PGN file.")
+    parser.add_argument("pgn_file", help="PGN file to read the game from")
+    parser.add_argument("--game", type=int, default=1,
+                        help="1-based number of the game to replay in a multi-game PGN file (default: 1)")
+    parser.add_argument("--index", action="store_true",
+                        help="find the game through the byte-offset index next to the PGN file, building it if needed")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL,
+                        help=f"plies between cached positions used for jumps (default: {KEYFRAME_INTERVAL})")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="report the memory used by the position cache on stderr when quitting")
+    script = parser.add_mutually_exclusive_group()
+    script.add_argument("--keys",
+                        help="run non-interactively, pressing each character of KEYS in turn")
+    script.add_argument("--batch", action="store_true",
+                        help="run non-interactively, reading one key per line from stdin")
+    args = parser.parse_args()
+    if args.game < 1:
+        parser.error("--game must be at least 1")
+    if args.keyframe_interval < 1:
+        parser.error("--keyframe-interval must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+
+    if args.keys is not None:
+        keys = list(args.keys)
+    elif args.batch:
+        keys = sys.stdin.read().splitlines()
+    else:
+        keys = None
+
+    # In batch mode all output is collected in one buffer and written once
+    out = sys.stdout if keys is None else io.StringIO()
+
+    script = interactive_keys() if keys is None else scripted_keys(keys, out)
+    replay_file(args.pgn_file, script, out, args.game, args.keyframe_interval, args.cache_stats, args.index)
+
+    if keys is not None:
+        sys.stdout.write(out.getvalue())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+import io
+import os
+import sys
+import json
+import stat
+import socket
+import argparse
+import tempfile
+import socketserver
+from functools import lru_cache
+
+import chess_sim
+import parse_moves
+
+# Socket the worker listens on and chess_client.py connects to by default: in
+# $XDG_RUNTIME_DIR, or else in a directory of the temp dir private to the user
+SOCKET_DIR = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"chess_worker-{os.getuid()}")
+DEFAULT_SOCKET = os.path.join(SOCKET_DIR, "chess_worker.sock")
+
+# Parsed games kept in memory, keyed by path, modification time and size
+GAME_CACHE_SIZE = 256
+
+@lru_cache(maxsize=GAME_CACHE_SIZE)
+def load_game(pgn_file, game_number, mtime_ns, size):
+    # mtime_ns and size are only part of the key, so an edited file is parsed again
+    return chess_sim.extract_pgn_data(pgn_file, game_number)
+
+def run_parse_moves(request):
+    # Same output as: python parse_moves.py "<pgn>"
+    out = io.StringIO()
+    err = io.StringIO()
+    parse_moves.print_uci_moves(request["pgn"], out, err)
+    return {"stdout": out.getvalue(), "stderr": err.getvalue(), "status": 0}
+
+def run_chess_sim(request):
+    # Same output as: python chess_sim.py <pgn_file> --game N --keys=<keys>
+    # "keys" is a list of lines, like the ones read by --batch, and a relative
+    # "pgn_file" is resolved against the client's "cwd"
+    pgn_file = request["pgn_file"]
+    path = os.path.join(request.get("cwd", ""), pgn_file)
+    game_number = request.get("game", 1)
+    try:
+        info = os.stat(path)
+        metadata, moves = load_game(path, game_number, info.st_mtime_ns, info.st_size)
+    except OSError as error:
+        return {"stdout": "", "stderr": f"{error}\n", "status": 1}
+
+    out = io.StringIO()
+    if metadata is None:
+        print(f"No game number {game_number} found in {pgn_file}", file=out)
+    else:
+        chess_sim.replay(metadata, moves, chess_sim.scripted_keys(request["keys"], out), out)
+    return {"stdout": out.getvalue(), "stderr": "", "status": 0}
+
+HANDLERS = {
+    "parse_moves": run_parse_moves,
+    "chess_sim": run_chess_sim,
+}
+
+def handle_request(line):
+    # One JSON request per line in, one JSON response per line out
+    try:
+        request = json.loads(line)
+        handler = HANDLERS[request["cmd"]]
+        response = handler(request)
+    except (ValueError, KeyError, TypeError) as error:
+        response = {"stdout": "", "stderr": f"Bad request: {error!r}\n", "status": 2}
+    return json.dumps(response) + "\n"
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # A client may send several requests over the same connection
+        for line in self.rfile:
+            self.wfile.write(handle_request(line.decode()).encode())
+            self.wfile.flush()
+
+def make_private_dir(directory):
+    # Create directory for this user only, and refuse one that someone else
+    # created (or could write to) in its place
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        sys.exit(f"{directory} is not a directory private to this user")
+
+def remove_stale_socket(socket_path):
+    # Remove a socket left behind by a worker that is no longer running. Anything
+    # else at socket_path (a live worker, a file that is not a socket) is kept.
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        sys.exit(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    sys.exit(f"Another worker is already listening on {socket_path}")
+
+def serve_socket(socket_path):
+    if socket_path == DEFAULT_SOCKET and not os.environ.get("XDG_RUNTIME_DIR"):
+        make_private_dir(SOCKET_DIR)
+    remove_stale_socket(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, WorkerHandler) as server:
+        # Remember which socket is ours, so only it is removed on exit
+        created = os.lstat(socket_path)
+        print(f"Worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try:
+                current = os.lstat(socket_path)
+            except FileNotFoundError:
+                current = None
+            if current and (current.st_dev, current.st_ino) == (created.st_dev, created.st_ino):
+                os.remove(socket_path)
+
+def serve_stdio():
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(handle_request(line))
+            sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived worker serving parse_moves.py and chess_sim.py requests.")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--socket", default=DEFAULT_SOCKET,
+                           help=f"Unix domain socket to listen on (default: {DEFAULT_SOCKET})")
+    transport.add_argument("--stdio", action="store_true",
+                           help="serve JSON line requests on stdin/stdout instead of a socket")
+    args = parser.parse_args()
+
+    if args.stdio:
+        serve_stdio()
+    else:
+        serve_socket(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import io
+import os
+import sys
+import json
+import mmap
+import argparse
+import chess.pgn
+
+# The index of games.pgn is stored next to it as games.pgn.idx
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+
+# Headers kept in the index for every game
+INDEXED_HEADERS = ["Event", "White", "Black", "Result", "Date"]
+
+def index_path(pgn_file):
+    return pgn_file + INDEX_SUFFIX
+
+def source_signature(pgn_file):
+    stat = os.stat(pgn_file)
+    return stat.st_size, stat.st_mtime_ns
+
+def build_index(pgn_file):
+    # Stream the file once through chess.pgn, so games are split exactly where
+    # chess_sim.py's --game N finds them, recording the byte offset and length of
+    # every game together with its indexed headers. The file is opened the way
+    # chess_sim.py opens it; at the line boundaries where a game starts, tell() of
+    # a text file is its byte offset.
+    size, mtime_ns = source_signature(pgn_file)
+    games = []
+    with open(pgn_file, 'r') as source:
+        offset = source.tell()
+        while True:
+            headers = chess.pgn.read_headers(source)
+            if headers is None:
+                break
+            end = source.tell()
+            games.append({"offset": offset, "length": end - offset,
+                          "headers": {name: headers[name] for name in INDEXED_HEADERS if name in headers}})
+            offset = end
+
+    return {"version": INDEX_VERSION, "size": size, "mtime_ns": mtime_ns, "games": games}
+
+def write_index(pgn_file, index):
+    # Write to a temporary file first so readers never see a half-written index
+    path = index_path(pgn_file)
+    with open(path + ".tmp", 'w') as file:
+        json.dump(index, file)
+    os.replace(path + ".tmp", path)
+
+def is_stale(pgn_file, index):
+    return (index.get("version") != INDEX_VERSION or
+            (index.get("size"), index.get("mtime_ns")) != source_signature(pgn_file))
+
+def load_index(pgn_file):
+    # The sidecar index, or None if it is missing, unreadable or stale
+    try:
+        with open(index_path(pgn_file), 'r') as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return None if is_stale(pgn_file, index) else index
+
+def get_index(pgn_file):
+    # Load the sidecar index, (re)building it when it is missing or stale
+    index = load_index(pgn_file)
+    if index is None:
+        index = build_index(pgn_file)
+        try:
+            write_index(pgn_file, index)
+        except OSError as error:
+            print(f"Could not write {index_path(pgn_file)}: {error}", file=sys.stderr)
+    return index
+
+def read_game_text(pgn_file, game_number, index=None):
+    # The text of the 1-based game_number, or None if the file has fewer games.
+    # The whole file is memory-mapped and only the game's indexed byte range is
+    # copied out of the map; nothing is read through a buffered file object.
+    index = index or get_index(pgn_file)
+    if not 1 <= game_number <= len(index["games"]):
+        return None
+
+    game = index["games"][game_number - 1]
+    with open(pgn_file, 'rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        raw = data[game["offset"]:game["offset"] + game["length"]]
+    # Decode the copied bytes and translate line endings the way a file opened
+    # in text mode would
+    with io.TextIOWrapper(io.BytesIO(raw)) as text:
+        return text.read()
+
+def main():
+    parser = argparse.ArgumentParser(description="Byte-offset game index for PGN files.")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+    build = commands.add_parser("build", help="(re)build the index of each file")
+    build.add_argument("pgn_files", nargs="+")
+    show = commands.add_parser("list", help="print the indexed games of a file")
+    show.add_argument("pgn_file")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        for pgn_file in args.pgn_files:
+            index = build_index(pgn_file)
+            write_index(pgn_file, index)
+            print(f"Indexed {len(index['games'])} games of {pgn_file} in {index_path(pgn_file)}")
+    else:
+        for number, game in enumerate(get_index(args.pgn_file)["games"], start=1):
+            headers = '\t'.join(game["headers"].get(name, "?") for name in INDEXED_HEADERS)
+            print(f"{number}\t{game['offset']}\t{game['length']}\t{headers}")
+
+if __name__ == "__main__":
+    main()
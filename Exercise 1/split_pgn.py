@@ -0,0 +1,67 @@
+import os
+import sys
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads writing the split game files
+WRITE_WORKERS = 8
+
+GAME_START = b"[Event "
+
+def find_game_offsets(data):
+    # (start, end) byte offsets of every game; a game starts at an "[Event " tag at
+    # the beginning of a line and runs up to the next one or the end of the file
+    starts = [0] if data[:len(GAME_START)] == GAME_START else []
+    position = data.find(b"\n" + GAME_START)
+    while position != -1:
+        starts.append(position + 1)
+        position = data.find(b"\n" + GAME_START, position + 1)
+    ends = starts[1:] + [len(data)]
+    return list(zip(starts, ends))
+
+def write_games(view, paths, offsets):
+    for path, (start, end) in zip(paths, offsets):
+        with open(path, 'wb') as file, view[start:end] as game:
+            file.write(game)
+
+def split_pgn(input_file, dest_dir, workers=WRITE_WORKERS):
+    # Write every game of input_file to dest_dir/<name>_<i>.pgn and return the paths.
+    # Games are written as zero-copy slices of the memory-mapped source file.
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    if os.path.getsize(input_file) == 0:
+        return []
+
+    with open(input_file, 'rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offsets = find_game_offsets(data)
+        paths = [os.path.join(dest_dir, f"{name}_{index}.pgn") for index in range(1, len(offsets) + 1)]
+        if not offsets:
+            return paths
+
+        # Each thread writes one contiguous run of games
+        step = -(-len(offsets) // workers)
+        runs = [(paths[first:first + step], offsets[first:first + step]) for first in range(0, len(offsets), step)]
+        with memoryview(data) as view, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_games, view, run_paths, run_offsets) for run_paths, run_offsets in runs]
+            for future in futures:
+                future.result()
+    return paths
+
+def main():
+    if len(sys.argv) != 3:
+        print(f"Usage: {sys.argv[0]} <source_pgn_file> <destination_directory>")
+        sys.exit(1)
+
+    input_file, dest_dir = sys.argv[1], sys.argv[2]
+    if not os.path.isfile(input_file):
+        print(f"Error: File '{input_file}' does not exist.")
+        sys.exit(1)
+    if not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+        print(f"Created directory '{dest_dir}'.")
+
+    for path in split_pgn(input_file, dest_dir):
+        print(f"Saved game to {path}")
+    print(f"All games have been split and saved to '{dest_dir}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import shutil
+
+import chess_sim
+import pgn_index
+
+ASHLEY_PGN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SubmissionTests", "tester", "pgns", "Ashley.pgn")
+
+def test_index_counts_games_like_chess_pgn(tmp_path):
+    # chess.pgn ends a game at a blank line, so in Ashley.pgn the movetext after
+    # two stray blank lines forms games of its own (380 and 382) with no [Event]
+    # tag; splitting on [Event lines numbered every later game differently
+    pgn_file = str(tmp_path / "Ashley.pgn")
+    shutil.copy(ASHLEY_PGN, pgn_file)
+    index = pgn_index.get_index(pgn_file)
+    assert len(index["games"]) == 416
+    for game_number in [1, 200, 400, 416, 417]:
+        assert chess_sim.extract_pgn_data(pgn_file, game_number, use_index=True) == \
+            chess_sim.extract_pgn_data(pgn_file, game_number)
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import chess
+import chess.pgn
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_DB = "feature_index.sqlite"
+
+# Files handed to a pool worker at a time
+POOL_CHUNK_SIZE = 16
+
+# Move features counted per game; each is also a --<feature> yes/no query filter
+FEATURES = ["castling", "en_passant", "promotions", "captures"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    plies INTEGER NOT NULL,
+    castling INTEGER NOT NULL,
+    en_passant INTEGER NOT NULL,
+    promotions INTEGER NOT NULL,
+    captures INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_folder ON games (folder);
+CREATE TABLE IF NOT EXISTS headers (
+    path TEXT NOT NULL REFERENCES games (path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS headers_path ON headers (path);
+CREATE INDEX IF NOT EXISTS headers_name_value ON headers (name, value);
+"""
+
+def open_index(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+def scan_game(file_path):
+    # Parse the first game of the file once and count its move features on a single board
+    with open(file_path, 'r') as file:
+        game = chess.pgn.read_game(file)
+
+    features = dict.fromkeys(FEATURES, 0)
+    if game is None:
+        return {}, 0, features
+
+    board = game.board()
+    plies = 0
+    for move in game.mainline_moves():
+        if board.is_castling(move):
+            features["castling"] += 1
+        if board.is_en_passant(move):
+            features["en_passant"] += 1
+        if move.promotion:
+            features["promotions"] += 1
+        if board.is_capture(move):
+            features["captures"] += 1
+        board.push(move)
+        plies += 1
+    return dict(game.headers), plies, features
+
+def update_index(conn, folder_path, workers=None):
+    # Re-scan only the .pgn files of the folder that are new or whose mtime or size
+    # changed, and drop the rows of files that no longer exist.
+    # Returns (scanned, unchanged, removed).
+    folder = os.path.realpath(folder_path)
+    indexed = {path: (mtime_ns, size) for path, mtime_ns, size in
+               conn.execute("SELECT path, mtime_ns, size FROM games WHERE folder = ?", (folder,))}
+
+    current = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith('.pgn') and entry.is_file():
+                stat = entry.stat()
+                current[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+    stale = sorted(path for path, signature in current.items() if indexed.get(path) != signature)
+    removed = [path for path in indexed if path not in current]
+
+    with conn:
+        conn.executemany("DELETE FROM games WHERE path = ?", [(path,) for path in stale + removed])
+        if stale:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for path, (headers, plies, features) in zip(stale, executor.map(scan_game, stale, chunksize=POOL_CHUNK_SIZE)):
+                    mtime_ns, size = current[path]
+                    conn.execute("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (path, folder, mtime_ns, size, plies, *(features[name] for name in FEATURES)))
+                    conn.executemany("INSERT INTO headers VALUES (?, ?, ?)",
+                                     [(path, name, value) for name, value in headers.items()])
+
+    return len(stale), len(current) - len(stale), len(removed)
+
+def query(conn, folder_path=None, features=None, headers=None, min_plies=None, max_plies=None):
+    # Paths of the indexed games matching every filter. `features` maps a feature
+    # name to True (occurs at least once) or False (never occurs), `headers` maps
+    # header names to required values.
+    conditions = []
+    params = []
+    if folder_path is not None:
+        conditions.append("folder = ?")
+        params.append(os.path.realpath(folder_path))
+    for name, present in (features or {}).items():
+        if name not in FEATURES:
+            raise ValueError(f"Unknown feature: {name}")
+        conditions.append(f"{name} {'>' if present else '='} 0")
+    for name, value in (headers or {}).items():
+        conditions.append("path IN (SELECT path FROM headers WHERE name = ? AND value = ?)")
+        params.extend([name, value])
+    if min_plies is not None:
+        conditions.append("plies >= ?")
+        params.append(min_plies)
+    if max_plies is not None:
+        conditions.append("plies <= ?")
+        params.append(max_plies)
+
+    sql = "SELECT path FROM games"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return [path for (path,) in conn.execute(sql + " ORDER BY path", params)]
+
+def yes_no(value):
+    if value not in ("yes", "no"):
+        raise argparse.ArgumentTypeError("expected 'yes' or 'no'")
+    return value == "yes"
+
+def header_filter(value):
+    name, separator, header_value = value.partition('=')
+    if not separator or not name:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    return name, header_value
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Persistent per-game feature index for folders of split PGN files.")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"SQLite index file (default: {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+
+    build = commands.add_parser("build", help="index the new and changed games of one or more folders")
+    build.add_argument("folders", nargs="+")
+    build.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU)")
+
+    search = commands.add_parser("query", help="print the paths of the indexed games matching all filters")
+    search.add_argument("--folder", help="only games from this folder")
+    for name in FEATURES:
+        search.add_argument(f"--{name.replace('_', '-')}", type=yes_no, metavar="yes|no",
+                            help=f"games with (yes) or without (no) {name.replace('_', ' ')}")
+    search.add_argument("--header", type=header_filter, action="append", default=[], metavar="NAME=VALUE",
+                        help="games whose header NAME equals VALUE, e.g. Result=1-0 (repeatable)")
+    search.add_argument("--min-plies", type=int)
+    search.add_argument("--max-plies", type=int)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    conn = open_index(args.db)
+
+    if args.cmd == "build":
+        for folder in args.folders:
+            if not os.path.isdir(folder):
+                print(f"The path {folder} is not a directory.")
+                continue
+            scanned, unchanged, removed = update_index(conn, folder, args.workers)
+            print(f"{folder}: {scanned} indexed, {unchanged} unchanged, {removed} removed")
+    else:
+        features = {name: getattr(args, name) for name in FEATURES if getattr(args, name) is not None}
+        start = time.perf_counter()
+        paths = query(conn, args.folder, features, dict(args.header), args.min_plies, args.max_plies)
+        elapsed = time.perf_counter() - start
+        for path in paths:
+            print(path)
+        print(f"{len(paths)} games in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+    conn.close()
+
+if __name__ == "__main__":
+    main()
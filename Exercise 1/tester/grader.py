@@ -1,10 +1,93 @@
 import os
 from os.path import isfile
+import csv
+import json
+import time
+import signal
 import shutil
-import pandas as pd
+import hashlib
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def run_tester(name, tester_script_path, testing_dir):
+# Number of students graded at the same time
+GRADING_WORKERS = os.cpu_count() or 1
+
+TESTER_TIMEOUT = 300
+
+# Points of each part, of the special bonus, and the penalty for C code in chess_sim.sh
+PART_POINTS = 33
+BONUS_POINTS = 10
+C_PATTERNS = ['scanf', 'main', '#include', 'void']
+C_CODE_PENALTY = 5
+
+# Result rows of earlier runs, keyed by student directory. Bump GRADER_VERSION
+# whenever a change to this file changes the rows it produces, so cached rows
+# are graded again.
+CACHE_FILE = "grader_cache.json"
+GRADER_VERSION = 2
+
+# Files of the tester directory that are not part of the tests
+IGNORED_DIRS = {"__pycache__"}
+IGNORED_SUFFIXES = (".pyc", ".pyo")
+
+# Resource usage of a whole tester.sh run, see run_with_timeout
+USAGE_COLUMNS = ['Wall Time (s)', 'User CPU (s)', 'Sys CPU (s)', 'Max RSS (KB)']
+
+# Columns of a result row, in CSV order. Every row has all of them; 'Part3 Score'
+# is only set (to 0) by Timeout and Error rows, as the serial grader's Timeout row did.
+COLUMNS = ['ID', 'Part1 Score', 'Part2 Score', 'Part3 Score', 'Total Score', 'Bonus Received'] + \
+    USAGE_COLUMNS + ['Output']
+
+# Output of a row whose tester run failed, followed by the error
+ERROR_OUTPUT = "Error: "
+
+# Per-test resource log written by tester.sh (through measure.py) and its columns
+RESOURCES_FILE = "resources.csv"
+TEST_COLUMNS = ['ID', 'test', 'exit_code', 'wall_s', 'user_s', 'sys_s', 'max_rss_kb']
+
+def kill_process_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def run_with_timeout(args, cwd, timeout):
+    # Like subprocess.run(..., timeout=timeout), but the whole process group is
+    # killed afterwards, so scripts started by tester.sh never outlive it or its sandbox.
+    # Returns the exit code and the resource usage of the run; the child is reaped
+    # with wait4, whose rusage covers tester.sh and every process it waited for.
+    # On timeout the TimeoutExpired carries the usage up to the kill as `usage`.
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=cwd, start_new_session=True)
+    waited = []
+    reaper = threading.Thread(target=lambda: waited.append(os.wait4(process.pid, 0)), daemon=True)
+    reaper.start()
+    reaper.join(timeout)
+    timed_out = reaper.is_alive()
+    kill_process_group(process.pid)
+    reaper.join()
+
+    _, status, rusage = waited[0]
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage = dict(zip(USAGE_COLUMNS, [round(time.perf_counter() - start, 3), round(rusage.ru_utime, 3),
+                                     round(rusage.ru_stime, 3), rusage.ru_maxrss]))
+    if timed_out:
+        error = subprocess.TimeoutExpired(args, timeout)
+        error.usage = usage
+        raise error
+    return process.returncode, usage
+
+def read_test_usage(tester_dir):
+    # Rows of the per-test resource log of a tester.sh run, if it wrote one
+    try:
+        with open(os.path.join(tester_dir, RESOURCES_FILE), 'r', newline='') as file:
+            return list(csv.DictReader(file))
+    except FileNotFoundError:
+        return []
+
+def run_tester(name, tester_script_path):
     # Ensure tester.sh has execute permissions
     print(f"Setting execute permissions for {tester_script_path}")
     subprocess.run(['chmod', '+x', tester_script_path], check=True)
@@ -14,13 +97,17 @@ def run_tester(name, tester_script_path, testing_dir):
     print(f"Running tester.sh script in directory {tester_dir} for {name}")
     
     try:
-        # Run the tester.sh script with the given name, with a timeout of 60 seconds
-        subprocess.run([tester_script_path, name], check=True, cwd=tester_dir, timeout=300)
-    except subprocess.TimeoutExpired:
+        # Run the tester.sh script with the given name, with a timeout of 300 seconds
+        returncode, usage = run_with_timeout([tester_script_path, name], tester_dir, TESTER_TIMEOUT)
+        if returncode != 0:
+            error = subprocess.CalledProcessError(returncode, tester_script_path)
+            error.usage = usage
+            raise error
+    except subprocess.TimeoutExpired as error:
         print(f"Tester script timed out for {name}")
-        cleanup_testing_directory(testing_dir)
-        return pd.DataFrame([[name, '0', '0', '0', '0', 'NO', 'Timeout']], 
-                            columns=['ID', 'Part1 Score', 'Part2 Score', 'Part3 Score', 'Total Score', 'Bonus Received', 'Output'])
+        row = dict(zip(COLUMNS, [name, 0, 0, 0, 0, 'NO']), **error.usage, Output='Timeout')
+        row['Tests'] = read_test_usage(tester_dir)
+        return row
     
     # Open the output file and read its contents
     output_file = os.path.join(tester_dir, f"{name}.txt")
@@ -67,102 +154,269 @@ def run_tester(name, tester_script_path, testing_dir):
         elif "BONUS: 10 points" in line:
             is_special_bonus = True
 
-    part1_score = (33 / len(part1_tests)) * part1_tests.count("PASSED") if part1_tests else 0
-    part2_score = (33 / len(part2_tests)) * part2_tests.count("PASSED") if part2_tests else 0
+    part1_score = (PART_POINTS / len(part1_tests)) * part1_tests.count("PASSED") if part1_tests else 0
+    part2_score = (PART_POINTS / len(part2_tests)) * part2_tests.count("PASSED") if part2_tests else 0
     
-    total_score = part1_score + part2_score + (10 if is_special_bonus else 0)
+    total_score = part1_score + part2_score + (BONUS_POINTS if is_special_bonus else 0)
     
-    # Prepare the DataFrame row
-    columns = ['ID', 'Part1 Score', 'Part2 Score', 'Total Score', 'Bonus Received', 'Output']
-    data = [name, part1_score, part2_score, total_score, 'YES' if is_special_bonus else 'NO', ''.join(lines)]
-    
-    df_row = pd.DataFrame([data], columns=columns)
-    return df_row
-
-def save_results_to_csv(df, filename):
-    print(f"Saving results to {filename}")
-    df.to_csv(filename, index=False)
-
-def cleanup_testing_directory(testing_dir):
-    # Clean up the testing directory, but keep necessary files
-    print(f"Cleaning up testing directory {testing_dir}")
-    for filename in os.listdir(testing_dir):
-        if filename not in ["chess_sim.py"]:
-            file_path = os.path.join(testing_dir, filename)
+    # Prepare the result row; 'Tests' holds the per-test resource usage, which goes
+    # to the JSONL file and the per-test breakdown instead of the CSV
+    data = [name, part1_score, part2_score, '', total_score, 'YES' if is_special_bonus else 'NO']
+    row = dict(zip(COLUMNS, data), **usage, Output=''.join(lines))
+    row['Tests'] = read_test_usage(tester_dir)
+    return row
+
+def jsonl_path(output_csv):
+    # The JSONL copy of test_results.csv is test_results.jsonl
+    return os.path.splitext(output_csv)[0] + ".jsonl"
+
+def tests_csv_path(output_csv):
+    # The per-test breakdown of test_results.csv is test_results_tests.csv
+    return os.path.splitext(output_csv)[0] + "_tests.csv"
+
+def graded_ids(output_csv):
+    # IDs of the students that already have a row in output_csv
+    try:
+        with open(output_csv, 'r', newline='') as file:
+            return {row['ID'] for row in csv.DictReader(file) if row.get('ID')}
+    except FileNotFoundError:
+        return set()
+
+def open_csv(path, columns, resume):
+    # A DictWriter appending to (resume) or replacing path, with the header written
+    # unless an existing file is being extended
+    write_header = not (resume and os.path.isfile(path) and os.path.getsize(path) > 0)
+    file = open(path, 'a' if resume else 'w', newline='')
+    writer = csv.DictWriter(file, fieldnames=columns, extrasaction='ignore')
+    if write_header:
+        writer.writeheader()
+    return file, writer
+
+class ResultWriter:
+    # Appends every result row to output_csv, its JSONL copy and the per-test
+    # resource breakdown as soon as it is written, so a crash loses at most the
+    # students still being graded.
+    # With resume the files are extended instead of being started over.
+
+    def __init__(self, output_csv, resume=False):
+        print(f"Saving results to {output_csv}, {jsonl_path(output_csv)} and {tests_csv_path(output_csv)}")
+        self.csv_file, self.csv_writer = open_csv(output_csv, COLUMNS, resume)
+        self.tests_file, self.tests_writer = open_csv(tests_csv_path(output_csv), TEST_COLUMNS, resume)
+        self.jsonl_file = open(jsonl_path(output_csv), 'a' if resume else 'w')
+
+    def write(self, row):
+        self.csv_writer.writerow(row)
+        for test in row.get('Tests', []):
+            self.tests_writer.writerow(dict(test, ID=row['ID']))
+        self.jsonl_file.write(json.dumps(row) + "\n")
+        for file in [self.csv_file, self.tests_file, self.jsonl_file]:
+            file.flush()
+
+    def close(self):
+        for file in [self.csv_file, self.tests_file, self.jsonl_file]:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def create_sandbox(student_path, testing_dir, tester_script_path):
+    # Build a private copy of the testing directory for one student: the files of
+    # testing_dir (e.g. the reference chess_sim.py), the student's files on top of
+    # them, and a copy of the tester directory. Returns (sandbox, sandboxed tester.sh).
+    sandbox = tempfile.mkdtemp(prefix="grader_")
+    for source_dir in [testing_dir, student_path]:
+        for filename in os.listdir(source_dir):
+            file_path = os.path.join(source_dir, filename)
+            dest_path = os.path.join(sandbox, filename)
             if os.path.isfile(file_path):
-                os.remove(file_path)
+                try:
+                    print(f"Copying {file_path} to {dest_path}")
+                    shutil.copy(file_path, dest_path)
+                except PermissionError as e:
+                    print(f"Permission error: {e}. Skipping this file.")
+                    continue
+
+    tester_dir = os.path.dirname(tester_script_path)
+    sandbox_tester_dir = os.path.join(sandbox, os.path.basename(tester_dir))
+    shutil.copytree(tester_dir, sandbox_tester_dir, symlinks=True)
+    return sandbox, os.path.join(sandbox_tester_dir, os.path.basename(tester_script_path))
+
+def hash_files(digest, root, file_paths):
+    # Feed the path (relative to root) and content of every file into digest
+    for file_path in sorted(file_paths):
+        digest.update(os.path.relpath(file_path, root).encode() + b"\0")
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+
+def is_bytecode(file_name):
+    return file_name.endswith(IGNORED_SUFFIXES)
+
+def top_level_files(directory):
+    return [os.path.join(directory, filename) for filename in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, filename))]
+
+def tester_hash(testing_dir, tester_script_path, ignored_paths=()):
+    # Hash of everything a sandbox is built from besides the submission: the files
+    # of testing_dir and the whole tester directory (tester.sh, tests_config.json,
+    # the test inputs and expected outputs). Python bytecode is left out, since
+    # running the tester writes it.
+    ignored = {os.path.realpath(path) for path in ignored_paths}
+    tester_dir = os.path.dirname(tester_script_path)
+    tester_files = []
+    for dir_path, dir_names, file_names in os.walk(tester_dir):
+        dir_names[:] = [dir_name for dir_name in dir_names if dir_name not in IGNORED_DIRS]
+        tester_files.extend(os.path.join(dir_path, file_name) for file_name in file_names
+                            if not is_bytecode(file_name))
+
+    digest = hashlib.sha256()
+    hash_files(digest, testing_dir, [path for path in top_level_files(testing_dir)
+                                     if os.path.realpath(path) not in ignored and not is_bytecode(path)])
+    hash_files(digest, tester_dir, [path for path in tester_files if os.path.realpath(path) not in ignored])
+    return digest.hexdigest()
+
+def grading_rules():
+    # Everything besides the tests that decides a row: the grader version, the
+    # tester timeout and the points and penalties
+    return json.dumps({"version": GRADER_VERSION, "timeout": TESTER_TIMEOUT, "part_points": PART_POINTS,
+                       "bonus_points": BONUS_POINTS, "c_patterns": C_PATTERNS, "c_code_penalty": C_CODE_PENALTY},
+                      sort_keys=True)
+
+def submission_key(student_path, tests_hash):
+    # Cache key of a submission: its files (as copied into the sandbox), the tests
+    # and the grading rules
+    digest = hashlib.sha256(tests_hash.encode() + b"\0" + grading_rules().encode())
+    hash_files(digest, student_path, top_level_files(student_path))
+    return digest.hexdigest()
+
+def is_cacheable(row):
+    # A timed out or failed run may only have been slow or broken this once (e.g.
+    # on a loaded machine), so it is graded again next time rather than cached
+    return row['Output'] != 'Timeout' and not row['Output'].startswith(ERROR_OUTPUT)
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def error_row(name, error):
+    # Row of a student whose tester run failed (a nonzero exit, a missing or
+    # unreadable output file), so the other students are still graded
+    usage = getattr(error, 'usage', dict.fromkeys(USAGE_COLUMNS, ''))
+    row = dict(zip(COLUMNS, [name, 0, 0, 0, 0, 'NO']), **usage, Output=f"{ERROR_OUTPUT}{error}")
+    row['Tests'] = []
+    return row
+
+def save_cache(cache_file, cache):
+    # Write to a temporary file first so an interrupted run never leaves a broken cache
+    with open(cache_file + ".tmp", 'w') as file:
+        json.dump(cache, file)
+    os.replace(cache_file + ".tmp", cache_file)
 
 def check_chess_sim_for_c_code(chess_sim_path):
     # Check for 'print' and other C patterns in chess_sim.sh
     print(f"Checking {chess_sim_path} for C code patterns")
-    c_patterns = ['scanf', 'main', '#include', 'void']
     with open(chess_sim_path, 'r') as file:
         content = file.read()
-        for pattern in c_patterns:
+        for pattern in C_PATTERNS:
             if pattern in content:
                 print(f"Pattern '{pattern}' found in {chess_sim_path}. Illegal usage detected.")
                 return True
     return False
 
 
-def process_students_and_run_tests(students_dir, testing_dir, tester_script_path, output_csv):
-    # Prepare a list to collect DataFrame rows
-    results = []
-
-    # Iterate over each directory in the students_dir
-    for student_dir in os.listdir(students_dir):
-        student_path = os.path.join(students_dir, student_dir)
-        if os.path.isdir(student_path):
-            print(f"Processing student directory {student_path}")
-            
-            # Copy all files from the student directory to the testing directory
-            for filename in os.listdir(student_path):
-                file_path = os.path.join(student_path, filename)
-                dest_path = os.path.join(testing_dir, filename)
-                if os.path.isfile(file_path):
-                    try:
-                        print(f"Copying {file_path} to {dest_path}")
-                        shutil.copy(file_path, dest_path)
-                    except PermissionError as e:
-                        print(f"Permission error: {e}. Skipping this file.")
-                        continue
-            
-            # Get the student name without the "-0"
-            student_name = student_dir.split('-')[0]
-            
-            # Run the tester for the student
-            df_row = run_tester(student_name, tester_script_path, testing_dir)
-            
-            # Check if chess_sim.sh contains C code patterns
-            chess_sim_path = os.path.join(testing_dir, 'chess_sim.sh')
-            # Check if chess_sim.sh exists and contains C code patterns
-            if os.path.isfile(chess_sim_path) and check_chess_sim_for_c_code(chess_sim_path):
-                # Deduct 10 points and update the output
-                df_row.loc[0, 'Total Score'] = max(0, df_row.loc[0, 'Total Score'] - 5)
-                df_row.loc[0, 'Output'] += '\nIllegal usage of C code detected in chess_sim.sh. 10 points deducted.'
-            cleanup_testing_directory(testing_dir)
-
-            results.append(df_row)
-    
-    # Combine all DataFrame rows into a single DataFrame
-    final_df = pd.concat(results, ignore_index=True)
-    
-    # Save the final DataFrame to a CSV file
-    save_results_to_csv(final_df, output_csv)
-
-    # Remove the directory named '2' inside the tester script path (if exists)
-    dir_to_remove = os.path.join(os.path.dirname(tester_script_path), '2')
-    if os.path.exists(dir_to_remove) and os.path.isdir(dir_to_remove):
-        print(f"Removing directory {dir_to_remove}")
-        shutil.rmtree(dir_to_remove)
-
-    # Delete specific files from the tester.sh directory if they exist
-    files_to_delete = ["chess_sim.py", "chess_sim.sh", "pgn_split.sh", "split_pgn.sh"]
-    for file_name in files_to_delete:
-        file_path = os.path.join(os.path.dirname(tester_script_path), file_name)
-        if os.path.isfile(file_path):
-            print(f"Deleting file {file_path}")
-            os.remove(file_path)
+def grade_student(student_path, testing_dir, tester_script_path):
+    # Grade one submission in its own sandbox and return its result row and the
+    # seconds it took
+    print(f"Processing student directory {student_path}")
+    start = time.perf_counter()
+    sandbox, sandbox_tester_path = create_sandbox(student_path, testing_dir, tester_script_path)
+    try:
+        # Get the student name without the "-0"
+        student_name = os.path.basename(student_path).split('-')[0]
+
+        # Run the tester for the student
+        try:
+            row = run_tester(student_name, sandbox_tester_path)
+        except (subprocess.CalledProcessError, OSError, ValueError) as error:
+            print(f"Tester failed for {student_name}: {error}")
+            row = error_row(student_name, error)
+
+        # Check if chess_sim.sh exists and contains C code patterns. A timed out or
+        # failed run is left as is: the serial grader had already removed the
+        # student's files by then, so it never scanned or deducted points from it.
+        chess_sim_path = os.path.join(sandbox, 'chess_sim.sh')
+        tested = row['Output'] != 'Timeout' and not row['Output'].startswith(ERROR_OUTPUT)
+        if tested and os.path.isfile(chess_sim_path) and check_chess_sim_for_c_code(chess_sim_path):
+            # Deduct 10 points and update the output
+            row['Total Score'] = max(0, row['Total Score'] - C_CODE_PENALTY)
+            row['Output'] += '\nIllegal usage of C code detected in chess_sim.sh. 10 points deducted.'
+        return row, time.perf_counter() - start
+    finally:
+        print(f"Removing sandbox {sandbox}")
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+def process_students_and_run_tests(students_dir, testing_dir, tester_script_path, output_csv, workers=GRADING_WORKERS,
+                                   cache_file=CACHE_FILE, resume=False):
+    # Every student directory is graded in its own sandbox (see create_sandbox), so
+    # the shared testing_dir and tester directory are never modified and up to
+    # `workers` students are graded concurrently. Rows are appended to output_csv
+    # (and its JSONL copy) as students finish.
+    # With a cache_file, a submission whose files, tester, tests_config.json and
+    # grading rules are unchanged since an earlier run reuses that run's row instead
+    # of being re-tested. Timeout and Error rows are never cached.
+    # With resume, students that already have a row in output_csv are skipped.
+    student_paths = [os.path.join(students_dir, student_dir) for student_dir in os.listdir(students_dir)]
+    student_paths = [student_path for student_path in student_paths if os.path.isdir(student_path)]
+
+    if resume:
+        done = graded_ids(output_csv)
+        skipped = [path for path in student_paths if os.path.basename(path).split('-')[0] in done]
+        student_paths = [path for path in student_paths if path not in skipped]
+        print(f"Resuming: {len(skipped)} students already in {output_csv}, {len(student_paths)} left")
+
+    with ResultWriter(output_csv, resume) as writer:
+        pending = student_paths
+        cache = {}
+        if cache_file:
+            cache = load_cache(cache_file)
+            tests_hash = tester_hash(testing_dir, tester_script_path,
+                                     [cache_file, cache_file + ".tmp", output_csv, jsonl_path(output_csv),
+                                      tests_csv_path(output_csv)])
+            keys = {student_path: submission_key(student_path, tests_hash) for student_path in student_paths}
+            time_saved = 0
+            pending = []
+            for student_path in student_paths:
+                entry = cache.get(os.path.basename(student_path))
+                if entry and entry["key"] == keys[student_path]:
+                    print(f"Reusing cached result for {student_path}")
+                    writer.write(entry["row"])
+                    time_saved += entry["seconds"]
+                else:
+                    pending.append(student_path)
+            print(f"Cache: {len(student_paths) - len(pending)} hits, {len(pending)} misses, "
+                  f"{time_saved:.1f}s of grading saved")
+
+        # Write each row as soon as its student is graded
+        graded = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(grade_student, student_path, testing_dir, tester_script_path): student_path
+                       for student_path in pending}
+            for future in as_completed(futures):
+                student_path = futures[future]
+                row, seconds = future.result()
+                writer.write(row)
+                graded += 1
+                print(f"Graded {student_path} ({graded}/{len(pending)})")
+                if cache_file and is_cacheable(row):
+                    cache[os.path.basename(student_path)] = {"key": keys[student_path], "row": row, "seconds": seconds}
+                    save_cache(cache_file, cache)
 
 # Example usage
 students_dir = "/home/itay/Documents/OS_Exercises/Exercises/ex1"
@@ -170,5 +424,8 @@ testing_dir = "/home/itay/Documents/OS_Exercises/Tester/Ex1"
 tester_script_path = "/home/itay/Documents/OS_Exercises/Tester/Ex1/tester/tester.sh"
 testing_script_path_dir = "/home/itay/Documents/OS_Exercises/Tester/Ex1/tester"
 output_csv = "test_results.csv"
+workers = GRADING_WORKERS
+cache_file = CACHE_FILE
+resume = False
 
-process_students_and_run_tests(students_dir, testing_dir, tester_script_path, output_csv)
\ No newline at end of file
+process_students_and_run_tests(students_dir, testing_dir, tester_script_path, output_csv, workers, cache_file, resume)
\ No newline at end of file
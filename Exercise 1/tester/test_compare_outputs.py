@@ -0,0 +1,36 @@
+import random
+import shutil
+import subprocess
+
+import pytest
+
+import compare_outputs
+
+# tester.sh's former preprocess_file, printed the way compare_file_contents saw it
+PREPROCESS_FILE = r"""
+preprocess_file() {
+    local FILE=$1
+    sed -e '/^[[:space:]]*$/d' -e ':a' -e 'N' -e '$!ba' -e 's/\n/\x0/' -e 's/[[:space:]]*$//' -e 's/\x0/\n/g' "$FILE" | sed -e '$a\'
+}
+printf '%s' "$(preprocess_file "$1")"
+"""
+
+# Inputs where trailing whitespace and blank lines meet
+CASES = [b"a\n", b"a \n\n", b"a \n \n", b"\n\na  \n", b"a\nb \n\n", b"a \nb\n", b"a\t\n\t\n\n", b"", b"\n \n",
+         b"a  ", b"a \r\n\r\n", b"a\n\nb  \n  \n"]
+
+def preprocess_file(path):
+    return subprocess.run(["bash", "-c", PREPROCESS_FILE, "preprocess_file", str(path)],
+                          stdout=subprocess.PIPE, check=True).stdout
+
+def fuzzed_inputs(count, seed=0):
+    rng = random.Random(seed)
+    pieces = [b"a", b"b", b" ", b"\t", b"\n", b"\n", b"\r"]
+    return [b"".join(rng.choice(pieces) for _ in range(rng.randrange(12))) for _ in range(count)]
+
+@pytest.mark.skipif(shutil.which("bash") is None or shutil.which("sed") is None, reason="needs bash and sed")
+def test_normalize_matches_preprocess_file(tmp_path):
+    path = tmp_path / "output.txt"
+    for data in CASES + fuzzed_inputs(400):
+        path.write_bytes(data)
+        assert compare_outputs.normalize(data) == preprocess_file(path), data
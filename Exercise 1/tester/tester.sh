@@ -32,31 +32,20 @@ check_missing_files() {
     fi
 }
 
-preprocess_file() {
-    local FILE=$1
-    sed -e '/^[[:space:]]*$/d' -e ':a' -e 'N' -e '$!ba' -e 's/\n/\x0/' -e 's/[[:space:]]*$//' -e 's/\x0/\n/g' "$FILE" | sed -e '$a\'
+# Run a student command through measure.py, which appends its wall time, CPU time
+# and peak RSS to the resource log as a row named after the test
+measure() {
+    local TEST_NAME=$1
+    shift
+    python3 "$CURRENT_DIR/measure.py" --log "$RESOURCES_FILE" --test "$TEST_NAME" -- "$@"
 }
 
+# Normalizes each file (leading blank lines and trailing whitespace are ignored),
+# compares the files by content hash and writes fails/test_*/diff_*.txt for mismatches
 compare_file_contents() {
     local OUTPUT_DIR=$1
     local EXPECTED_OUTPUT_DIR=$2
-    CONTENT_MISMATCH=0
-    for EXPECTED_FILE in "$EXPECTED_OUTPUT_DIR"/*; do
-        FILE_NAME=$(basename "$EXPECTED_FILE")
-        if [[ -f "$OUTPUT_DIR/$FILE_NAME" ]]; then
-            EXPECTED_CONTENT=$(preprocess_file "$EXPECTED_FILE")
-            OUTPUT_CONTENT=$(preprocess_file "$OUTPUT_DIR/$FILE_NAME")
-            DIFF=$(diff <(echo "$EXPECTED_CONTENT") <(echo "$OUTPUT_CONTENT"))
-            if [[ -n "$DIFF" ]]; then
-                CONTENT_MISMATCH=1
-                FAIL_DIR="fails/test_$(basename "$OUTPUT_DIR")"
-                mkdir -p "$FAIL_DIR"
-                echo "$DIFF" > "$FAIL_DIR/diff_$FILE_NAME.txt"
-            fi
-        fi
-    done
-
-    if [[ $CONTENT_MISMATCH -eq 0 ]]; then
+    if python3 "$CURRENT_DIR/compare_outputs.py" "$OUTPUT_DIR" "$EXPECTED_OUTPUT_DIR"; then
         echo -e "${GREEN}All file contents match the expected output.${NC}"
     fi
 }
@@ -99,7 +88,7 @@ run_part_1_tests() {
         mkdir -p "$OUTPUT_DIR"
 
         echo -e "${BLUE}Running the split script...${NC}"
-        if ! ./"$SPLIT_SCRIPT" "$INPUT" "$OUTPUT_DIR" > /dev/null 2>&1; then
+        if ! measure "part_1:$INPUT" ./"$SPLIT_SCRIPT" "$INPUT" "$OUTPUT_DIR" > /dev/null 2>&1; then
             echo -e "${RED}Failed to run the split script${NC}"
             continue
         fi
@@ -157,6 +146,7 @@ run_part_2_tests() {
 
     for TEST in $PART_2_TESTS; do
         ((TEST_NUM++))
+        TEST_NAME="part_2:$TEST_NUM"
         INPUT_PATH_PGN=$(echo "$TEST" | jq -r '.input_path_pgn')
         MOVES=$(echo "$TEST" | jq -r '.moves')
 
@@ -172,10 +162,10 @@ run_part_2_tests() {
         MOVES_WITH_ENTER=$(echo "$MOVES" | sed 's/./&\n/g')
 
         # Run chess_sim.sh
-        echo -e "$MOVES_WITH_ENTER" | ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
+        echo -e "$MOVES_WITH_ENTER" | measure "$TEST_NAME" ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
 
         # Run chess_sim.py
-        echo -e "$MOVES_WITH_ENTER" | python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" > "$TEMP_DIR/expected_output.txt" 2>&1
+        python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" --keys="$MOVES" > "$TEMP_DIR/expected_output.txt" 2>&1
 
         # Compare outputs
         DIFF=$(diff -u "$TEMP_DIR/student_output.txt" "$TEMP_DIR/expected_output.txt")
@@ -240,6 +230,7 @@ run_part_2_special_tests() {
 
     for TEST in $PART_2_SPECIAL_TESTS; do
         ((TEST_NUM++))
+        TEST_NAME="part_2_special:$TEST_NUM"
         INPUT_PATH_PGN=$(echo "$TEST" | jq -r '.input_path_pgn')
         MOVES=$(echo "$TEST" | jq -r '.moves')
 
@@ -255,10 +246,10 @@ run_part_2_special_tests() {
         MOVES_WITH_ENTER=$(echo "$MOVES" | sed 's/./&\n/g')
 
         # Run chess_sim.sh
-        echo -e "$MOVES_WITH_ENTER" | ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
+        echo -e "$MOVES_WITH_ENTER" | measure "$TEST_NAME" ./"$CHESS_SIM_SCRIPT" "$INPUT_PATH_PGN" > "$TEMP_DIR/student_output.txt" 2>&1
 
         # Run chess_sim.py
-        echo -e "$MOVES_WITH_ENTER" | python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" > "$TEMP_DIR/expected_output.txt" 2>&1
+        python3 "$CHESS_SIM_PY" "$INPUT_PATH_PGN" --keys="$MOVES" > "$TEMP_DIR/expected_output.txt" 2>&1
 
         # Compare outputs
         DIFF=$(diff -u "$TEMP_DIR/student_output.txt" "$TEMP_DIR/expected_output.txt")
@@ -294,6 +285,10 @@ run_part_2_special_tests() {
 
 CURRENT_DIR=$(pwd)
 
+# Per-test resource usage of the student's scripts, see measure()
+RESOURCES_FILE="$CURRENT_DIR/resources.csv"
+rm -f "$RESOURCES_FILE"
+
 PART_1_TESTS=$(jq -c '.part_1[]' "$CONFIG_FILE")
 PART_2_TESTS=$(jq -c '.part_2[]' "$CONFIG_FILE")
 PART_2_SPECIAL_TESTS=$(jq -c '.part_2_special[]' "$CONFIG_FILE")
@@ -303,3 +298,7 @@ run_part_1_tests
 run_part_2_tests
 
 run_part_2_special_tests
+
+if [[ -f "$RESOURCES_FILE" ]]; then
+    echo -e "${BLUE}Resource usage of every test saved to $RESOURCES_FILE${NC}"
+fi
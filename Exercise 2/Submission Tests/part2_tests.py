@@ -2,9 +2,40 @@ import subprocess
 import json
 import time
 import re
+import csv
+import pty
+import random
+import select
+import argparse
+import itertools
+import tempfile
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
+
+from measure import kill_process_group, run_measured, write_resources
+
+# Seconds each test may run
+TEST_TIMEOUT = 50
+
+# Number of tests run at the same time
+DEFAULT_JOBS = os.cpu_count() or 1
+
+# Benchmark sweep (--benchmark): number of messages (writers), writes per writer,
+# and the order given to the ordering argument
+BENCH_MESSAGES = [3, 6, 10]
+BENCH_COUNTS = [1, 5, 10]
+BENCH_ORDERS = ["identity", "reverse", "shuffled"]
+BENCH_COLUMNS = ["messages", "count", "order", "status", "wall_s", "user_s", "sys_s", "max_rss_kb",
+                 "lines", "lines_per_s", "blocks", "interleavings", "order_inversions", "fairness",
+                 "mean_wait_s", "max_wait_s"]
+
 def check_code(c_file):
     with open(c_file, 'r') as file:
         code = file.read()
@@ -13,67 +44,226 @@ def check_code(c_file):
     return True
 
 def compile_c_file(c_file, output_file):
+    if compile_cache is not None:
+        return compile_cache.compile_cached([c_file], output_file)
     try:
         subprocess.run(['gcc', c_file, '-o', output_file], check=True, stderr=subprocess.PIPE)
         return True
     except subprocess.CalledProcessError:
         return False
 
-def run_test(executable, test, test_number):
-    args = [executable] + [f'"{arg}"' if ' ' in arg else arg for arg in test['args']]
-    command = ' '.join(args)
-    try:
-        result = subprocess.run(command, check=True, capture_output=True, shell=True, timeout=50)
-        output = result.stdout.decode().strip().split('\n')
-        
-        # Check if the output file exists
-        if os.path.exists('output2.txt'):
-            with open('output2.txt', 'r') as file:
-                output = file.read().strip().split('\n')
+def run_test(executable, test, test_number, timeout=TEST_TIMEOUT):
+    # Runs the test in its own scratch directory, so that it starts without an
+    # output2.txt and cannot see the files of other tests.
+    # Returns the result line and the resource usage of the test.
+    with tempfile.TemporaryDirectory(prefix=f"part2_test_{test_number}_") as scratch_dir:
+        try:
+            result, usage = run_measured([executable] + test['args'], check=True, timeout=timeout, cwd=scratch_dir)
+            output = result.stdout.decode().strip().split('\n')
 
-        output_count = len(output)
-        output_counter = Counter(output)
+            # Check if the output file exists
+            output_path = os.path.join(scratch_dir, 'output2.txt')
+            if os.path.exists(output_path):
+                with open(output_path, 'r') as file:
+                    output = file.read().strip().split('\n')
 
-        expected_count = test['expected_count']
-        expected_messages = test['expected_messages']
+            output_count = len(output)
+            output_counter = Counter(output)
 
-        if output_count == expected_count and all(output_counter[msg] == expected_count // len(expected_messages) for msg in expected_messages):
-            return f"TEST_{test_number}, PASSED"
-        else:
-            return f"TEST_{test_number}, FAILED"
+            expected_count = test['expected_count']
+            expected_messages = test['expected_messages']
 
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-        return f"TEST_{test_number}, FAILED"
+            if output_count == expected_count and all(output_counter[msg] == expected_count // len(expected_messages) for msg in expected_messages):
+                return f"TEST_{test_number}, PASSED", usage
+            else:
+                return f"TEST_{test_number}, FAILED", usage
 
-def run_tests(executable, config_file):
-    results = []
-    start_time = time.time()
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
+            return f"TEST_{test_number}, FAILED", error.usage
 
+def run_tests(executable, config_file, jobs=DEFAULT_JOBS, timeout=TEST_TIMEOUT):
+    # Runs up to `jobs` tests at the same time, each with its own timeout.
+    # Returns the result lines and the per-test resource breakdown, in test order.
+    executable = os.path.abspath(executable)
     with open(config_file, 'r') as f:
         config = json.load(f)
-    
-    for i, test in enumerate(config['tests'], start=1):
-        elapsed_time = time.time() - start_time
-        if elapsed_time > 50:
-            results.extend([f"TEST_{j}, FAILED" for j in range(i, len(config['tests']) + 1)])
-            break
-        result = run_test(executable, test, i)
-        results.append(result)
-    
-    return results
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_test, executable, test, i, timeout)
+                   for i, test in enumerate(config['tests'], start=1)]
+        outcomes = [future.result() for future in futures]
+
+    results = [result for result, _ in outcomes]
+    resources = [{"test": f"TEST_{i}", "status": result.split(", ")[1], **usage}
+                 for i, (result, usage) in enumerate(outcomes, start=1)]
+    return results, resources
+
+def bench_case(messages, count, order, rng):
+    # argv of one benchmark run: the messages, the ordering argument and the count,
+    # as in config.json, and every writer in the order the argument asks for.
+    # The ordering argument comes from config.json, not Part2.md: part2 writes it
+    # like any other message, so it is a writer too, ranked last as in argv.
+    texts = [f"Message {i}" for i in range(1, messages + 1)]
+    permutation = list(range(1, messages + 1))
+    if order == "reverse":
+        permutation.reverse()
+    elif order == "shuffled":
+        rng.shuffle(permutation)
+    ordering = ' '.join(map(str, permutation))
+    return texts + [ordering, str(count)], [texts[i - 1] for i in permutation] + [ordering]
+
+def analyze_output(lines, expected_order):
+    # Interleaving and ordering of the writers of expected_order in an output2.txt,
+    # all computed over the lines of those writers:
+    # blocks - runs of the same message; a writer that held the lock for all of its
+    #          writes forms exactly one block
+    # interleavings - blocks beyond one per writer
+    # order_inversions - pairs of writers that first wrote in the opposite of the
+    #          requested order
+    # fairness - Jain's index of the lines written per writer (1.0 when all equal)
+    rank = {message: i for i, message in enumerate(expected_order)}
+    lines = [line for line in lines if line in rank]
+    blocks = [message for message, _ in itertools.groupby(lines)]
+    first_seen = list(dict.fromkeys(lines))
+    inversions = sum(1 for a, b in itertools.combinations(first_seen, 2) if rank[a] > rank[b])
+    counts = [lines.count(message) for message in expected_order]
+    fairness = sum(counts) ** 2 / (len(counts) * sum(c * c for c in counts)) if any(counts) else 0
+    return {"lines": len(lines), "blocks": len(blocks), "interleavings": len(blocks) - len(set(blocks)),
+            "order_inversions": inversions, "fairness": round(fairness, 3)}
+
+def writer_waits(executable, args, timeout, cwd):
+    # Run the program with stdout on a pseudo-terminal, so each printf reaches us
+    # when it is made, and return how long each writer waited before its first
+    # line appeared (the time spent waiting for the other writers and the lock)
+    master, slave = pty.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen([executable] + args, stdout=slave, stderr=subprocess.DEVNULL,
+                               cwd=cwd, start_new_session=True)
+    os.close(slave)
+    first_line = {}
+    pending = b""
+    deadline = start + timeout
+    try:
+        while time.perf_counter() < deadline:
+            ready, _, _ = select.select([master], [], [], deadline - time.perf_counter())
+            if not ready:
+                break
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                break
+            if not data:
+                break
+            now = time.perf_counter()
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                first_line.setdefault(line.rstrip(b"\r").decode(errors="replace"), now - start)
+    finally:
+        kill_process_group(process.pid)
+        process.wait()
+        os.close(master)
+    return first_line
+
+def run_benchmark(executable, timeout=TEST_TIMEOUT, messages=BENCH_MESSAGES, counts=BENCH_COUNTS,
+                  orders=BENCH_ORDERS, seed=0):
+    # Sweep the program over every (messages, count, order) combination and return
+    # one row of BENCH_COLUMNS per run. Runs are sequential so they do not slow
+    # each other down. Each combination runs twice: once with stdout in
+    # output2.txt, as graded, for the timings and the output analysis, and once on
+    # a pseudo-terminal to time when every writer starts writing.
+    executable = os.path.abspath(executable)
+    rng = random.Random(seed)
+    rows = []
+    for n, count, order in itertools.product(messages, counts, orders):
+        args, expected_order = bench_case(n, count, order, rng)
+        row = {"messages": n, "count": count, "order": order}
+        with tempfile.TemporaryDirectory(prefix="part2_bench_") as scratch_dir:
+            output_path = os.path.join(scratch_dir, 'output2.txt')
+            try:
+                with open(output_path, 'w') as output:
+                    _, usage = run_measured([executable] + args, check=True, timeout=timeout,
+                                            capture_output=False, stdout=output, cwd=scratch_dir)
+                row["status"] = "OK"
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
+                usage = error.usage
+                row["status"] = "TIMEOUT" if isinstance(error, subprocess.TimeoutExpired) else "ERROR"
+            row.update(usage)
+
+            with open(output_path, 'r', errors='replace') as output:
+                lines = output.read().strip().split('\n')
+            row.update(analyze_output(lines, expected_order))
+            row["lines_per_s"] = round(row["lines"] / usage["wall_s"], 1) if usage["wall_s"] else 0
+
+            os.remove(output_path)
+            waits = writer_waits(executable, args, timeout, scratch_dir)
+            waits = [waits[message] for message in expected_order if message in waits]
+            row["mean_wait_s"] = round(sum(waits) / len(waits), 3) if waits else ""
+            row["max_wait_s"] = round(max(waits), 3) if waits else ""
+        rows.append(row)
+    return rows
+
+def write_benchmark(benchmark_file, rows):
+    with open(benchmark_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=BENCH_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def print_benchmark(rows):
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in BENCH_COLUMNS]
+    for values in [BENCH_COLUMNS] + [[row[column] for column in BENCH_COLUMNS] for row in rows]:
+        print('  '.join(str(value).rjust(width) for value, width in zip(values, widths)))
+
+def int_list(value):
+    try:
+        return [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected comma separated integers")
+
+def order_list(value):
+    orders = value.split(',')
+    if not set(orders) <= set(BENCH_ORDERS):
+        raise argparse.ArgumentTypeError(f"orders are {', '.join(BENCH_ORDERS)}")
+    return orders
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile part2.c and run the tests of config.json.")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of tests run at the same time (default: {DEFAULT_JOBS})")
+    parser.add_argument("--timeout", type=float, default=TEST_TIMEOUT,
+                        help=f"seconds each test may run (default: {TEST_TIMEOUT})")
+    bench = parser.add_argument_group("benchmark", "measure how part2 scales instead of running the tests")
+    bench.add_argument("--benchmark", metavar="CSV", nargs="?", const="part2_benchmark.csv",
+                       help="run the benchmark sweep and write its rows to CSV (default: part2_benchmark.csv)")
+    bench.add_argument("--bench-messages", type=int_list, default=BENCH_MESSAGES,
+                       help=f"numbers of messages (writers) to sweep (default: {','.join(map(str, BENCH_MESSAGES))})")
+    bench.add_argument("--bench-counts", type=int_list, default=BENCH_COUNTS,
+                       help=f"writes per writer to sweep (default: {','.join(map(str, BENCH_COUNTS))})")
+    bench.add_argument("--bench-orders", type=order_list, default=BENCH_ORDERS,
+                       help=f"orders given to the ordering argument (default: {','.join(BENCH_ORDERS)})")
+    bench.add_argument("--seed", type=int, default=0, help="seed of the shuffled orders (default: 0)")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     c_file = 'part2.c'
     output_file = 'part2'
     config_file = 'config.json'
     output_results_file = 'part2_output.txt'
+    resources_file = 'part2_resources.csv'
 
     if not check_code(c_file):
         results = ["TEST_ILEGAL_USAGE" for _ in range(len(json.load(open(config_file))['tests']))]
-    elif compile_c_file(c_file, output_file):
-        results = run_tests(f'./{output_file}', config_file)
-    else:
+    elif not compile_c_file(c_file, output_file):
         results = ["Compilation failed"]
+    elif args.benchmark:
+        rows = run_benchmark(f'./{output_file}', args.timeout, args.bench_messages, args.bench_counts,
+                             args.bench_orders, args.seed)
+        write_benchmark(args.benchmark, rows)
+        print_benchmark(rows)
+        return
+    else:
+        results, resources = run_tests(f'./{output_file}', config_file, args.jobs, args.timeout)
+        write_resources(resources_file, resources)
 
     with open(output_results_file, 'w') as f:
         for result in results:
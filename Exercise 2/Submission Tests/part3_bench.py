@@ -0,0 +1,519 @@
+import os
+import re
+import sys
+import csv
+import json
+import math
+import time
+import ctypes
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
+
+# BUFFER_SIZE values the library is rebuilt with
+BENCH_BUFFER_SIZES = [512, 4096, 65536]
+
+# Workload name -> (record size in bytes, total MiB). "random_write" writes
+# records of random size averaging the record size, "mixed" alternates reads and
+# writes of one record on a file opened O_RDWR.
+WORKLOADS = {
+    "seq_write": (256, 4),
+    "seq_read": (256, 4),
+    "random_write": (256, 4),
+    "small_write": (8, 0.5),
+    "mixed": (256, 2),
+}
+
+BENCH_COLUMNS = ["impl", "buffer_size", "workload", "record", "mib", "seconds", "mib_per_s", "speedup",
+                 "syscalls", "read_calls", "write_calls", "lseek_calls", "syscall_mib", "syscalls_per_mib",
+                 "syscall_reduction"]
+
+# O_PREAPPEND sweep: bytes already in the file, record sizes, records between
+# buffered_flush calls (0: only at close) and the record counts the cost curve
+# is fitted over
+O_PREAPPEND = 0x40000000
+PREAPPEND_INITIAL_KIB = [0, 64]
+PREAPPEND_RECORDS = [16, 256]
+PREAPPEND_FLUSH_EVERY = [1, 16, 0]
+PREAPPEND_COUNTS = [64, 128, 256, 512]
+
+# A run is flagged when it moves more than this many times the bytes of the
+# model, which rewrites the file once per flush
+PREAPPEND_EXCESS = 2.0
+
+PREAPPEND_COLUMNS = ["initial", "record", "flush_every", "count", "seconds", "read_bytes", "write_bytes",
+                     "moved_bytes", "model_bytes", "ideal_bytes", "excess", "final_size", "flag"]
+FIT_COLUMNS = ["initial", "record", "flush_every", "bytes_exponent", "model_exponent", "time_exponent", "flag"]
+
+# Decimal places of the float columns in the CSV and the tables; the rows keep
+# full precision for the fits and the flags
+PREAPPEND_DIGITS = {"seconds": 4, "excess": 2}
+FIT_DIGITS = {"bytes_exponent": 2, "model_exponent": 2, "time_exponent": 2}
+
+# LD_PRELOAD shim that counts the read/write/lseek calls (and the bytes they
+# move) made while counting is enabled, through the shim_* functions
+SHIM_SOURCE = r"""
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <unistd.h>
+#include <sys/types.h>
+
+enum { READ, WRITE, LSEEK, KINDS };
+static long counts[KINDS];
+static long long moved[KINDS];
+static int enabled;
+
+void shim_enable(int on) { enabled = on; }
+void shim_reset(void) { for (int i = 0; i < KINDS; i++) counts[i] = moved[i] = 0; }
+long shim_count(int kind) { return counts[kind]; }
+long long shim_bytes(int kind) { return moved[kind]; }
+
+static void record(int kind, ssize_t result) {
+    if (enabled) {
+        counts[kind]++;
+        if (result > 0 && kind != LSEEK)
+            moved[kind] += result;
+    }
+}
+
+#define WRAP_IO(name, kind, buf_type) \
+    ssize_t name(int fd, buf_type buf, size_t count) { \
+        static ssize_t (*real)(int, buf_type, size_t); \
+        if (!real) real = dlsym(RTLD_NEXT, #name); \
+        ssize_t result = real(fd, buf, count); \
+        record(kind, result); \
+        return result; \
+    }
+WRAP_IO(read, READ, void *)
+WRAP_IO(write, WRITE, const void *)
+
+#define WRAP_PIO(name, kind, buf_type) \
+    ssize_t name(int fd, buf_type buf, size_t count, off_t offset) { \
+        static ssize_t (*real)(int, buf_type, size_t, off_t); \
+        if (!real) real = dlsym(RTLD_NEXT, #name); \
+        ssize_t result = real(fd, buf, count, offset); \
+        record(kind, result); \
+        return result; \
+    }
+WRAP_PIO(pread, READ, void *)
+WRAP_PIO(pread64, READ, void *)
+WRAP_PIO(pwrite, WRITE, const void *)
+WRAP_PIO(pwrite64, WRITE, const void *)
+
+#define WRAP_SEEK(name) \
+    off_t name(int fd, off_t offset, int whence) { \
+        static off_t (*real)(int, off_t, int); \
+        if (!real) real = dlsym(RTLD_NEXT, #name); \
+        off_t result = real(fd, offset, whence); \
+        record(LSEEK, result); \
+        return result; \
+    }
+WRAP_SEEK(lseek)
+WRAP_SEEK(lseek64)
+"""
+
+def build(sources, output, flags, cwd):
+    if compile_cache is not None:
+        return compile_cache.compile_cached(sources, output, flags, cwd=cwd)
+    result = subprocess.run(["gcc"] + sources + flags + ["-o", output], cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return result.returncode == 0
+
+def build_library(submission_dir, build_dir, buffer_size):
+    # Build buffered_open.c as a shared library whose BUFFER_SIZE is buffer_size.
+    # The header's fixed #define is made overridable in a private copy, so a
+    # submission that hard-codes its buffer size elsewhere will not change.
+    lib_dir = os.path.join(build_dir, f"lib_{buffer_size}")
+    os.makedirs(lib_dir, exist_ok=True)
+    shutil.copy(os.path.join(submission_dir, "buffered_open.c"), lib_dir)
+    with open(os.path.join(submission_dir, "buffered_open.h"), 'r') as file:
+        header = file.read()
+    header = re.sub(r"^[ \t]*#[ \t]*define[ \t]+BUFFER_SIZE\b.*$",
+                    lambda match: f"#ifndef BUFFER_SIZE\n{match.group(0)}\n#endif", header, flags=re.M)
+    with open(os.path.join(lib_dir, "buffered_open.h"), 'w') as file:
+        file.write(header)
+
+    output = "libbuffered_open.so"
+    if not build(["buffered_open.c"], output, ["-shared", "-fPIC", "-O2", f"-DBUFFER_SIZE={buffer_size}"], lib_dir):
+        return None
+    return os.path.join(lib_dir, output)
+
+def build_shim(build_dir):
+    with open(os.path.join(build_dir, "syscall_shim.c"), 'w') as file:
+        file.write(SHIM_SOURCE)
+    if not build(["syscall_shim.c"], "syscall_shim.so", ["-shared", "-fPIC", "-O2", "-ldl"], build_dir):
+        return None
+    return os.path.join(build_dir, "syscall_shim.so")
+
+class RawFile:
+    # The unbuffered baseline: one os.read/os.write per call
+
+    def __init__(self, path, flags):
+        self.fd = os.open(path, flags, 0o644)
+
+    def write(self, data):
+        return os.write(self.fd, data)
+
+    def read(self, count):
+        return len(os.read(self.fd, count))
+
+    def close(self):
+        os.close(self.fd)
+
+class BufferedFile:
+    # A buffered_file_t of the submission's library, loaded through ctypes
+
+    def __init__(self, lib, path, flags):
+        self.lib = lib
+        self.bf = lib.buffered_open(path.encode(), ctypes.c_int(flags), ctypes.c_int(0o644))
+        if not self.bf:
+            raise OSError(ctypes.get_errno(), f"buffered_open failed for {path}")
+        self.buffer = ctypes.create_string_buffer(1 << 20)
+
+    def write(self, data):
+        return self.lib.buffered_write(self.bf, data, len(data))
+
+    def read(self, count):
+        return self.lib.buffered_read(self.bf, self.buffer, count)
+
+    def flush(self):
+        return self.lib.buffered_flush(self.bf)
+
+    def close(self):
+        return self.lib.buffered_close(self.bf)
+
+def load_library(path):
+    lib = ctypes.CDLL(path, use_errno=True)
+    lib.buffered_open.restype = ctypes.c_void_p
+    lib.buffered_write.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+    lib.buffered_write.restype = ctypes.c_ssize_t
+    lib.buffered_read.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+    lib.buffered_read.restype = ctypes.c_ssize_t
+    lib.buffered_flush.argtypes = [ctypes.c_void_p]
+    lib.buffered_close.argtypes = [ctypes.c_void_p]
+    return lib
+
+def records(workload, record, total, seed=0):
+    # Sizes of the records a workload moves, adding up to total bytes
+    rng = random.Random(seed)
+    sizes = []
+    remaining = total
+    while remaining > 0:
+        size = rng.randint(1, 2 * record - 1) if workload == "random_write" else record
+        sizes.append(min(size, remaining))
+        remaining -= sizes[-1]
+    return sizes
+
+def prepare_workload(workload, total, path):
+    # The reading workloads start from a file of total random bytes
+    if workload in ("seq_read", "mixed"):
+        with open(path, 'wb') as file:
+            file.write(os.urandom(total))
+
+def run_workload(open_file, workload, record, total, path):
+    # Run one workload on path through open_file(path, flags) and return the
+    # seconds it took, closing (and so flushing) the file included
+    sizes = records(workload, record, total)
+    payload = os.urandom(2 * record)
+    start = time.perf_counter()
+    if workload == "seq_read":
+        file = open_file(path, os.O_RDONLY)
+        for size in sizes:
+            file.read(size)
+    elif workload == "mixed":
+        file = open_file(path, os.O_RDWR)
+        for i, size in enumerate(sizes):
+            if i % 2:
+                file.write(payload[:size])
+            else:
+                file.read(size)
+    else:
+        file = open_file(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        for size in sizes:
+            file.write(payload[:size])
+    file.close()
+    return time.perf_counter() - start
+
+def load_shim(shim_path):
+    # The shim preloaded into this process, whose counters the workloads read
+    shim = ctypes.CDLL(shim_path)
+    shim.shim_bytes.restype = ctypes.c_longlong
+    shim.shim_count.restype = ctypes.c_long
+    return shim
+
+def worker(lib_path, shim_path, scale, work_dir):
+    # Runs inside a process started with LD_PRELOAD=<shim>; prints one JSON row
+    # per workload with its time and the syscalls the shim counted
+    shim = load_shim(shim_path)
+    if lib_path == "raw":
+        open_file = RawFile
+    else:
+        lib = load_library(lib_path)
+        open_file = lambda path, flags: BufferedFile(lib, path, flags)
+
+    rows = []
+    for workload, (record, mib) in WORKLOADS.items():
+        total = int(mib * scale * (1 << 20))
+        path = os.path.join(work_dir, f"{workload}.dat")
+        prepare_workload(workload, total, path)
+        shim.shim_reset()
+        shim.shim_enable(1)
+        seconds = run_workload(open_file, workload, record, total, path)
+        shim.shim_enable(0)
+        counts = [shim.shim_count(kind) for kind in range(3)]
+        rows.append({"workload": workload, "record": record, "bytes": total, "seconds": seconds,
+                     "read_calls": counts[0], "write_calls": counts[1], "lseek_calls": counts[2],
+                     "syscall_bytes": shim.shim_bytes(0) + shim.shim_bytes(1)})
+        os.remove(path)
+    print(json.dumps(rows))
+
+def run_preappend(lib, shim, path, case):
+    # Prepend case["count"] records to a file of case["initial"] bytes, calling
+    # buffered_flush every case["flush_every"] records, and count what it costs
+    with open(path, 'wb') as file:
+        file.write(os.urandom(case["initial"]))
+    payload = os.urandom(case["record"])
+
+    shim.shim_reset()
+    shim.shim_enable(1)
+    start = time.perf_counter()
+    file = BufferedFile(lib, path, os.O_RDWR | os.O_CREAT | O_PREAPPEND)
+    for i in range(1, case["count"] + 1):
+        file.write(payload)
+        if case["flush_every"] and i % case["flush_every"] == 0:
+            file.flush()
+    file.close()
+    seconds = time.perf_counter() - start
+    shim.shim_enable(0)
+
+    result = dict(case, seconds=seconds, read_bytes=shim.shim_bytes(0), write_bytes=shim.shim_bytes(1),
+                  final_size=os.path.getsize(path))
+    os.remove(path)
+    return result
+
+def preappend_worker(lib_path, shim_path, work_dir, cases):
+    # Runs inside a process started with LD_PRELOAD=<shim>; prints the results
+    # of the O_PREAPPEND cases as one JSON list
+    shim = load_shim(shim_path)
+    lib = load_library(lib_path)
+    path = os.path.join(work_dir, "preappend.dat")
+    print(json.dumps([run_preappend(lib, shim, path, case) for case in cases]))
+
+def measure(worker_args, shim_path):
+    # Run a worker of this script in a fresh process with the counting shim
+    # preloaded and return the JSON it printed
+    env = dict(os.environ, LD_PRELOAD=shim_path)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__)] + worker_args, env=env,
+                            stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode().strip().split("\n")[-1])
+
+def summarize(impl, buffer_size, rows, baseline):
+    summary = []
+    for row in rows:
+        raw = baseline[row["workload"]]
+        mib = row["bytes"] / (1 << 20)
+        syscalls = row["read_calls"] + row["write_calls"] + row["lseek_calls"]
+        raw_syscalls = raw["read_calls"] + raw["write_calls"] + raw["lseek_calls"]
+        summary.append({
+            "impl": impl, "buffer_size": buffer_size, "workload": row["workload"], "record": row["record"],
+            "mib": round(mib, 2), "seconds": round(row["seconds"], 4),
+            "mib_per_s": round(mib / row["seconds"], 1) if row["seconds"] else "",
+            "speedup": round(raw["seconds"] / row["seconds"], 2) if row["seconds"] else "",
+            "syscalls": syscalls, "read_calls": row["read_calls"], "write_calls": row["write_calls"],
+            "lseek_calls": row["lseek_calls"], "syscall_mib": round(row["syscall_bytes"] / (1 << 20), 2),
+            "syscalls_per_mib": round(syscalls / mib, 1) if mib else "",
+            "syscall_reduction": round(raw_syscalls / syscalls, 1) if syscalls else "",
+        })
+    return summary
+
+def run_benchmark(submission_dir, buffer_sizes=BENCH_BUFFER_SIZES, scale=1.0):
+    # Rows of BENCH_COLUMNS: the raw os.read/os.write baseline, then the
+    # submission built with every buffer size
+    build_dir = tempfile.mkdtemp(prefix="part3_bench_")
+    try:
+        shim_path = build_shim(build_dir)
+        if shim_path is None:
+            raise RuntimeError("Could not build the syscall counting shim")
+        raw_rows = measure(["--worker", "raw", shim_path, str(scale), build_dir], shim_path)
+        baseline = {row["workload"]: row for row in raw_rows}
+        results = summarize("raw", "", raw_rows, baseline)
+        for buffer_size in buffer_sizes:
+            lib_path = build_library(submission_dir, build_dir, buffer_size)
+            if lib_path is None:
+                print(f"Could not build buffered_open.c with BUFFER_SIZE={buffer_size}", file=sys.stderr)
+                continue
+            rows = measure(["--worker", lib_path, shim_path, str(scale), build_dir], shim_path)
+            results += summarize("buffered", buffer_size, rows, baseline)
+        return results
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+def flush_chunks(record, count, flush_every, buffer_size):
+    # Sizes of the blocks a library prepends: everything written between two
+    # buffered_flush calls (or up to close), in pieces of at most one full buffer
+    interval = flush_every or count
+    chunks = []
+    for first in range(0, count, interval):
+        pending = min(interval, count - first) * record
+        while pending > 0:
+            chunks.append(min(pending, buffer_size))
+            pending -= chunks[-1]
+    return chunks
+
+def model_bytes(initial, chunks):
+    # Bytes moved by prepending each chunk the way Part3.md describes: read the
+    # current content, then write the chunk followed by that content
+    size = initial
+    moved = 0
+    for chunk in chunks:
+        moved += 2 * size + chunk
+        size += chunk
+    return moved
+
+def fit_exponent(xs, ys):
+    # Least-squares slope of log(y) over log(x): y grows like x**slope
+    points = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    if len(points) < 2:
+        return ""
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return ""
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+def preappend_cases(initial_kib, records, flush_every, counts):
+    return [{"initial": kib * 1024, "record": record, "flush_every": every, "count": count}
+            for kib in initial_kib for record in records for every in flush_every for count in counts]
+
+def summarize_preappend(results, buffer_size, excess):
+    # Rows of PREAPPEND_COLUMNS for every run and of FIT_COLUMNS for every sweep
+    # over the record count
+    rows = []
+    for result in results:
+        moved = result["read_bytes"] + result["write_bytes"]
+        model = model_bytes(result["initial"], flush_chunks(result["record"], result["count"],
+                                                            result["flush_every"], buffer_size))
+        ratio = moved / model if model else ""
+        if result["final_size"] != result["initial"] + result["count"] * result["record"]:
+            flag = "WRONG SIZE"
+        elif ratio and ratio > excess:
+            flag = "EXCESS"
+        else:
+            flag = ""
+        rows.append({**result, "moved_bytes": moved, "model_bytes": model,
+                     "ideal_bytes": 2 * result["initial"] + result["count"] * result["record"],
+                     "excess": ratio, "flag": flag})
+
+    fits = []
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["initial"], row["record"], row["flush_every"]), []).append(row)
+    for (initial, record, flush_every), group in groups.items():
+        counts = [row["count"] for row in group]
+        fit = {"initial": initial, "record": record, "flush_every": flush_every,
+               "bytes_exponent": fit_exponent(counts, [row["moved_bytes"] for row in group]),
+               "model_exponent": fit_exponent(counts, [row["model_bytes"] for row in group]),
+               "time_exponent": fit_exponent(counts, [row["seconds"] for row in group])}
+        # Growing half a power of N faster than the model means the cost is in the
+        # implementation, not in what O_PREAPPEND has to do
+        steeper = fit["bytes_exponent"] != "" and fit["model_exponent"] != "" and \
+            fit["bytes_exponent"] > fit["model_exponent"] + 0.5
+        fit["flag"] = "STEEPER THAN MODEL" if steeper else ""
+        fits.append(fit)
+    return rows, fits
+
+def run_preappend_benchmark(submission_dir, cases, buffer_size=4096, excess=PREAPPEND_EXCESS):
+    # Build the submission once and run every O_PREAPPEND case with the shim
+    build_dir = tempfile.mkdtemp(prefix="part3_preappend_")
+    try:
+        shim_path = build_shim(build_dir)
+        if shim_path is None:
+            raise RuntimeError("Could not build the syscall counting shim")
+        lib_path = build_library(submission_dir, build_dir, buffer_size)
+        if lib_path is None:
+            raise RuntimeError(f"Could not build buffered_open.c with BUFFER_SIZE={buffer_size}")
+        results = measure(["--preappend-worker", lib_path, shim_path, build_dir, json.dumps(cases)], shim_path)
+        return summarize_preappend(results, buffer_size, excess)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+def rounded(rows, digits):
+    # Copies of rows with the columns in digits rounded, for writing them out
+    return [{column: round(value, digits[column]) if column in digits and value != "" else value
+             for column, value in row.items()} for row in rows]
+
+def print_table(rows, columns=BENCH_COLUMNS):
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    for values in [columns] + [[row[column] for column in columns] for row in rows]:
+        print('  '.join(str(value).rjust(width) for value, width in zip(values, widths)))
+
+def int_list(value):
+    try:
+        return [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected comma separated integers")
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == "--worker":
+        worker(sys.argv[2], sys.argv[3], float(sys.argv[4]), sys.argv[5])
+        return
+    if len(sys.argv) == 6 and sys.argv[1] == "--preappend-worker":
+        preappend_worker(sys.argv[2], sys.argv[3], sys.argv[4], json.loads(sys.argv[5]))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark buffered_open.c against raw os.read/os.write, counting syscalls.")
+    parser.add_argument("--dir", default=".", help="directory with buffered_open.c and buffered_open.h (default: .)")
+    parser.add_argument("--buffer-sizes", type=int_list, default=BENCH_BUFFER_SIZES,
+                        help=f"BUFFER_SIZE values to build with (default: {','.join(map(str, BENCH_BUFFER_SIZES))})")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the data size of every workload")
+    parser.add_argument("--output", default="part3_benchmark.csv", help="CSV file (default: part3_benchmark.csv)")
+    parser.add_argument("--preappend", nargs="?", const="part3_preappend.csv", metavar="CSV",
+                        help="measure how the cost of O_PREAPPEND writes scales instead, saving the runs to CSV "
+                             "(default: part3_preappend.csv)")
+    parser.add_argument("--buffer-size", type=int, default=4096, help="BUFFER_SIZE of the O_PREAPPEND runs (default: 4096)")
+    parser.add_argument("--initial-kib", type=int_list, default=PREAPPEND_INITIAL_KIB,
+                        help=f"KiB in the file before prepending (default: {','.join(map(str, PREAPPEND_INITIAL_KIB))})")
+    parser.add_argument("--records", type=int_list, default=PREAPPEND_RECORDS,
+                        help=f"record sizes to prepend (default: {','.join(map(str, PREAPPEND_RECORDS))})")
+    parser.add_argument("--flush-every", type=int_list, default=PREAPPEND_FLUSH_EVERY,
+                        help="records between buffered_flush calls, 0 for only at close "
+                             f"(default: {','.join(map(str, PREAPPEND_FLUSH_EVERY))})")
+    parser.add_argument("--counts", type=int_list, default=PREAPPEND_COUNTS,
+                        help=f"numbers of records to fit the cost over (default: {','.join(map(str, PREAPPEND_COUNTS))})")
+    parser.add_argument("--excess", type=float, default=PREAPPEND_EXCESS,
+                        help=f"flag runs moving more than this many times the model's bytes (default: {PREAPPEND_EXCESS})")
+    args = parser.parse_args()
+
+    if args.preappend:
+        cases = preappend_cases(args.initial_kib, args.records, args.flush_every, args.counts)
+        rows, fits = run_preappend_benchmark(args.dir, cases, args.buffer_size, args.excess)
+        write_csv(args.preappend, PREAPPEND_COLUMNS, rounded(rows, PREAPPEND_DIGITS))
+        print_table(rounded(rows, PREAPPEND_DIGITS), PREAPPEND_COLUMNS)
+        print()
+        print_table(rounded(fits, FIT_DIGITS), FIT_COLUMNS)
+        flagged = sum(1 for row in rows if row["flag"]) + sum(1 for fit in fits if fit["flag"])
+        if flagged:
+            print(f"\n{flagged} result(s) flagged")
+        return
+
+    rows = run_benchmark(args.dir, args.buffer_sizes, args.scale)
+    write_csv(args.output, BENCH_COLUMNS, rows)
+    print_table(rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import csv
+import sys
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
+
+# Shape of the generated tree: directory levels below the root, subdirectories
+# and entries per directory
+TREE_DEPTH = 3
+TREE_FANOUT = 4
+TREE_ENTRIES = 16
+
+# Regular file sizes are log-uniform between these bounds (0 allowed as a minimum)
+TREE_MIN_SIZE = 0
+TREE_MAX_SIZE = 1 << 20
+
+# Fraction of the files made sparse: sparse_size bytes long with a few data blocks
+TREE_SPARSE_RATIO = 0.0
+TREE_SPARSE_SIZE = 1 << 30
+SPARSE_EXTENTS = 4
+
+# Fraction of the entries made symlinks, to an earlier entry of the tree. Unless
+# cycles are asked for, a link never points at a directory containing it, so
+# following links always terminates.
+TREE_SYMLINK_RATIO = 0.05
+
+# Permissions handed out to files and directories; both stay readable (and
+# directories writable) by their owner so the tree can be copied and removed
+FILE_MODES = [0o644, 0o600, 0o755, 0o444, 0o640]
+DIR_MODES = [0o755, 0o750, 0o700]
+
+# Copies made by each copier, the fastest of which is reported
+BENCH_REPEAT = 3
+
+BENCH_COLUMNS = ["copier", "files", "dirs", "symlinks", "mib", "seconds", "files_per_s", "mib_per_s",
+                 "dest_allocated_mib", "status"]
+
+def file_size(rng, min_size, max_size):
+    low = math.log(min_size + 1)
+    high = math.log(max_size + 1)
+    return int(math.exp(rng.uniform(low, high))) - 1
+
+def write_file(path, rng, size):
+    with open(path, 'wb') as file:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1 << 20)
+            file.write(rng.randbytes(chunk))
+            remaining -= chunk
+
+def write_sparse_file(path, rng, size):
+    # A hole of size bytes with SPARSE_EXTENTS blocks of data scattered over it
+    with open(path, 'wb') as file:
+        file.truncate(size)
+        for _ in range(SPARSE_EXTENTS):
+            file.seek(rng.randrange(max(size - 4096, 1)))
+            file.write(rng.randbytes(min(4096, size)))
+
+def generate_tree(root, seed, depth=TREE_DEPTH, fanout=TREE_FANOUT, entries=TREE_ENTRIES,
+                  min_size=TREE_MIN_SIZE, max_size=TREE_MAX_SIZE, sparse_ratio=TREE_SPARSE_RATIO,
+                  sparse_size=TREE_SPARSE_SIZE, symlink_ratio=TREE_SYMLINK_RATIO, file_modes=FILE_MODES,
+                  dir_modes=DIR_MODES, cycles=False):
+    # Build the same tree under root for the same seed and parameters. Returns
+    # the number of files, directories (the root excluded) and symlinks, and the
+    # logical size of the files in bytes.
+    rng = random.Random(seed)
+    stats = {"files": 0, "dirs": 0, "symlinks": 0, "bytes": 0}
+    targets = []
+    # Directories being populated: the one entries go into and its ancestors
+    open_dirs = set()
+    directory_modes = []
+    os.makedirs(root)
+
+    def populate(directory, level):
+        for i in range(entries):
+            path = os.path.join(directory, f"f{i:03d}")
+            candidates = targets if cycles else [target for target in targets if target not in open_dirs]
+            if candidates and rng.random() < symlink_ratio:
+                target = rng.choice(candidates)
+                os.symlink(os.path.relpath(target, directory), path)
+                stats["symlinks"] += 1
+                continue
+            if rng.random() < sparse_ratio:
+                size = sparse_size
+                write_sparse_file(path, rng, size)
+            else:
+                size = file_size(rng, min_size, max_size)
+                write_file(path, rng, size)
+            os.chmod(path, rng.choice(file_modes))
+            targets.append(path)
+            stats["files"] += 1
+            stats["bytes"] += size
+        if level < depth:
+            for i in range(fanout):
+                path = os.path.join(directory, f"d{i:03d}")
+                os.mkdir(path)
+                stats["dirs"] += 1
+                targets.append(path)
+                directory_modes.append((path, rng.choice(dir_modes)))
+                open_dirs.add(path)
+                populate(path, level + 1)
+                open_dirs.discard(path)
+
+    populate(root, 1)
+    # Directory permissions last, since some of them are not group/other writable
+    for path, mode in directory_modes:
+        os.chmod(path, mode)
+    return stats
+
+def allocated_bytes(root):
+    total = 0
+    for directory, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            total += os.lstat(os.path.join(directory, name)).st_blocks * 512
+    return total
+
+def build_copytree(directory):
+    # The submitted copytree binary, built from part4.c and copytree.c
+    if compile_cache is not None:
+        return compile_cache.build_preset("part4", directory)
+    result = subprocess.run(["gcc", "part4.c", "copytree.c", "-o", "copytree"], cwd=directory)
+    return result.returncode == 0
+
+def copiers(binary, flags):
+    # name -> function copying a tree to a destination that does not exist yet.
+    # Returns True when the copier reported success.
+    def run(command):
+        return subprocess.run(command, stdout=subprocess.DEVNULL).returncode == 0
+
+    def python_copy(source, destination):
+        shutil.copytree(source, destination, symlinks=True)
+        return True
+
+    return {
+        "copytree": lambda source, destination: run([binary] + flags + [source, destination]),
+        "shutil.copytree": python_copy,
+        "cp -a": lambda source, destination: run(["cp", "-a", source, destination]),
+    }
+
+def benchmark(source, stats, binary, flags, repeat=BENCH_REPEAT, work_dir=None):
+    # Rows of BENCH_COLUMNS, one per copier, with the fastest of `repeat` copies
+    rows = []
+    mib = stats["bytes"] / (1 << 20)
+    for name, copy in copiers(binary, flags).items():
+        best = None
+        status = "OK"
+        allocated = 0
+        for _ in range(repeat):
+            destination = tempfile.mkdtemp(prefix="part4_bench_", dir=work_dir)
+            target = os.path.join(destination, "copy")
+            try:
+                start = time.perf_counter()
+                ok = copy(source, target)
+                seconds = time.perf_counter() - start
+                allocated = allocated_bytes(target) if os.path.isdir(target) else 0
+            except OSError as error:
+                ok = False
+                status = f"ERROR: {error}"
+            finally:
+                shutil.rmtree(destination, ignore_errors=True)
+            if not ok:
+                status = status if status != "OK" else "FAILED"
+                break
+            best = seconds if best is None else min(best, seconds)
+
+        rows.append({
+            "copier": name, "files": stats["files"], "dirs": stats["dirs"], "symlinks": stats["symlinks"],
+            "mib": round(mib, 1), "seconds": round(best, 4) if best is not None else "",
+            "files_per_s": round(stats["files"] / best, 1) if best else "",
+            "mib_per_s": round(mib / best, 1) if best else "",
+            "dest_allocated_mib": round(allocated / (1 << 20), 1), "status": status,
+        })
+    return rows
+
+def print_table(rows):
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in BENCH_COLUMNS]
+    for values in [BENCH_COLUMNS] + [[row[column] for column in BENCH_COLUMNS] for row in rows]:
+        print('  '.join(str(value).rjust(width) for value, width in zip(values, widths)))
+
+def mode_list(value):
+    try:
+        return [int(item, 8) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected comma separated octal modes")
+
+def add_tree_arguments(parser):
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the tree (default: 0)")
+    parser.add_argument("--depth", type=int, default=TREE_DEPTH, help=f"directory levels (default: {TREE_DEPTH})")
+    parser.add_argument("--fanout", type=int, default=TREE_FANOUT, help=f"subdirectories per directory (default: {TREE_FANOUT})")
+    parser.add_argument("--entries", type=int, default=TREE_ENTRIES,
+                        help=f"files and symlinks per directory (default: {TREE_ENTRIES})")
+    parser.add_argument("--min-size", type=int, default=TREE_MIN_SIZE, help=f"smallest file in bytes (default: {TREE_MIN_SIZE})")
+    parser.add_argument("--max-size", type=int, default=TREE_MAX_SIZE, help=f"largest file in bytes (default: {TREE_MAX_SIZE})")
+    parser.add_argument("--sparse-ratio", type=float, default=TREE_SPARSE_RATIO,
+                        help=f"fraction of sparse files (default: {TREE_SPARSE_RATIO})")
+    parser.add_argument("--sparse-size", type=int, default=TREE_SPARSE_SIZE,
+                        help=f"size of a sparse file in bytes (default: {TREE_SPARSE_SIZE})")
+    parser.add_argument("--symlink-ratio", type=float, default=TREE_SYMLINK_RATIO,
+                        help=f"fraction of entries that are symlinks (default: {TREE_SYMLINK_RATIO})")
+    parser.add_argument("--cycles", action="store_true",
+                        help="let symlinks point at directories containing them, making cycles")
+    parser.add_argument("--file-modes", type=mode_list, default=FILE_MODES,
+                        help=f"octal file permissions to pick from (default: {','.join(f'{mode:o}' for mode in FILE_MODES)})")
+    parser.add_argument("--dir-modes", type=mode_list, default=DIR_MODES,
+                        help=f"octal directory permissions to pick from (default: {','.join(f'{mode:o}' for mode in DIR_MODES)})")
+
+def tree_options(args):
+    return {"depth": args.depth, "fanout": args.fanout, "entries": args.entries, "min_size": args.min_size,
+            "max_size": args.max_size, "sparse_ratio": args.sparse_ratio, "sparse_size": args.sparse_size,
+            "symlink_ratio": args.symlink_ratio, "file_modes": args.file_modes, "dir_modes": args.dir_modes,
+            "cycles": args.cycles}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate large synthetic trees and benchmark copytree on them.")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+    generate = commands.add_parser("generate", help="build a tree at a new path")
+    generate.add_argument("root")
+    add_tree_arguments(generate)
+    bench = commands.add_parser("bench", help="time copytree, shutil.copytree and cp -a on a generated tree")
+    add_tree_arguments(bench)
+    bench.add_argument("--dir", default=".", help="directory with part4.c and copytree.c (default: .)")
+    bench.add_argument("--flags", default="-l -p", help="copytree flags (default: \"-l -p\", what cp -a does)")
+    bench.add_argument("--repeat", type=int, default=BENCH_REPEAT, help=f"copies per copier (default: {BENCH_REPEAT})")
+    bench.add_argument("--work-dir", help="where the tree and its copies go (default: the system temp directory)")
+    bench.add_argument("--output", default="part4_benchmark.csv", help="CSV file (default: part4_benchmark.csv)")
+    args = parser.parse_args()
+
+    if args.cmd == "generate":
+        stats = generate_tree(args.root, args.seed, **tree_options(args))
+        print(f"{args.root}: {stats['files']} files, {stats['dirs']} directories, {stats['symlinks']} symlinks, "
+              f"{stats['bytes'] / (1 << 20):.1f} MiB")
+        return
+
+    if not build_copytree(args.dir):
+        print("Compilation failed", file=sys.stderr)
+        sys.exit(1)
+    work_dir = tempfile.mkdtemp(prefix="part4_tree_", dir=args.work_dir)
+    try:
+        source = os.path.join(work_dir, "tree")
+        stats = generate_tree(source, args.seed, **tree_options(args))
+        rows = benchmark(source, stats, os.path.abspath(os.path.join(args.dir, "copytree")), args.flags.split(),
+                         args.repeat, args.work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=BENCH_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print_table(rows)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,41 @@
 import subprocess
 import json
 import os
+import sys
+import mmap
+import stat
 import shutil
-import signal
+import argparse
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-class TimeoutException(Exception):
-    pass
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
 
-def timeout_handler(signum, frame):
-    raise TimeoutException
+from measure import run_measured, write_resources
+
+# Seconds each test case may run, and the number of test cases run at the same time
+TEST_TIMEOUT = 30
+DEFAULT_JOBS = os.cpu_count() or 1
+
+# Files hashed at the same time when verifying a copy, and the number of
+# differences reported for a failed test
+VERIFY_JOBS = os.cpu_count() or 1
+MAX_DIFFERENCES = 10
+
+# Files from this size on are hashed through mmap, smaller ones with one read
+MMAP_MIN_SIZE = 1 << 16
 
 def compile_c_files():
-    subprocess.run(["sudo", "gcc", "part4.c", "copytree.c", "-o", "copytree"], check=True)
+    command = ["sudo", "gcc", "part4.c", "copytree.c", "-o", "copytree"]
+    if compile_cache is None:
+        subprocess.run(command, check=True)
+    elif not compile_cache.compile_cached(["part4.c", "copytree.c"], "copytree", compiler=["sudo", "gcc"]):
+        raise subprocess.CalledProcessError(1, command)
 
 def setup_test_environment(test_case):
     os.makedirs(test_case['source_directory'], exist_ok=True)
@@ -27,89 +51,189 @@ def setup_test_environment(test_case):
         elif item['type'] == 'symlink':
             os.symlink(item['target'], item_path)
 
-def run_test_case(test_case):
-    setup_test_environment(test_case)
-    command = ["sudo", "./copytree"]
+def sudo_without_password():
+    # copytree runs through sudo in a session of its own (see run_measured), away
+    # from the terminal, where sudo cannot ask for a password
+    result = subprocess.run(["sudo", "-n", "true"], start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def run_copytree(test_case, timeout):
+    # Returns the resource usage of the copytree run
+    command = ["sudo", os.path.abspath("copytree")]
     if test_case['copy_symlinks']:
         command.append("-l")
     if test_case['copy_permissions']:
         command.append("-p")
     command.extend([test_case['source_directory'], test_case['destination_directory']])
-    subprocess.run(command, check=True)
+    _, usage = run_measured(command, check=True, capture_output=False, timeout=timeout)
+    return usage
 
-def verify_test_result(test_case):
-    for item in test_case['items']:
-        dest_item_path = os.path.join(test_case['destination_directory'], item['name'])
-        if item['type'] == 'file':
-            if not os.path.isfile(dest_item_path):
-                return False
-            if (os.stat(dest_item_path).st_mode & 0o777) != (item['permissions'] & 0o777):
-                return False
-        elif item['type'] == 'directory':
-            if not os.path.isdir(dest_item_path):
-                return False
-            if (os.stat(dest_item_path).st_mode & 0o777) != (item['permissions'] & 0o777):
-                return False
-        elif item['type'] == 'symlink':
-            if not os.path.islink(dest_item_path):
-                return False
-            if os.readlink(dest_item_path) != item['target']:
-                return False
-    return True
-
-def run_tests():
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(30)  # Set timeout to 30 seconds
+def file_digest(path):
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < MMAP_MIN_SIZE:
+            return hashlib.sha1(file.read()).digest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha1(data).digest()
 
+def same_contents(source, destination):
+    try:
+        return file_digest(source) == file_digest(destination)
+    except OSError:
+        return False
+
+def scan(directory):
+    with os.scandir(directory) as entries:
+        return {entry.name: entry for entry in entries}
+
+def compare_trees(source, destination, copy_symlinks, differences, pending, relative=""):
+    # Walk source and destination side by side, appending (path, problem) to
+    # differences for everything but file contents. Files of equal size are
+    # appended to pending as (path, source file, destination file) to be hashed.
+    # Without copy_symlinks a symlink must have been copied as what it points to.
+    try:
+        source_entries = scan(source)
+        destination_entries = scan(destination)
+    except OSError as error:
+        differences.append((relative or ".", f"cannot be listed: {error.strerror}"))
+        return
+
+    for name in sorted(source_entries):
+        path = os.path.join(relative, name)
+        entry = source_entries[name]
+        copy = destination_entries.get(name)
+        if copy is None:
+            differences.append((path, "missing"))
+            continue
+        try:
+            if entry.is_symlink() and copy_symlinks:
+                if not copy.is_symlink():
+                    differences.append((path, "is not a symlink"))
+                elif os.readlink(copy.path) != os.readlink(entry.path):
+                    differences.append((path, f"links to {os.readlink(copy.path)} instead of {os.readlink(entry.path)}"))
+                continue
+            source_stat = entry.stat(follow_symlinks=True)
+            copy_stat = copy.stat(follow_symlinks=False)
+        except OSError as error:
+            differences.append((path, f"cannot be read: {error.strerror}"))
+            continue
+
+        if stat.S_ISDIR(source_stat.st_mode):
+            if not stat.S_ISDIR(copy_stat.st_mode):
+                differences.append((path, "is not a directory"))
+                continue
+        elif not stat.S_ISREG(copy_stat.st_mode):
+            differences.append((path, "is not a regular file"))
+            continue
+        if (copy_stat.st_mode & 0o777) != (source_stat.st_mode & 0o777):
+            differences.append((path, f"has mode {copy_stat.st_mode & 0o777:o} instead of {source_stat.st_mode & 0o777:o}"))
+
+        if stat.S_ISDIR(source_stat.st_mode):
+            if not entry.is_symlink():
+                compare_trees(entry.path, copy.path, copy_symlinks, differences, pending, path)
+        elif copy_stat.st_size != source_stat.st_size:
+            differences.append((path, f"has {copy_stat.st_size} bytes instead of {source_stat.st_size}"))
+        else:
+            pending.append((path, entry.path, copy.path))
+
+    for name in sorted(set(destination_entries) - set(source_entries)):
+        differences.append((os.path.join(relative, name), "was not in the source"))
+
+def verify_test_result(test_case, max_differences=MAX_DIFFERENCES, jobs=VERIFY_JOBS):
+    # Compare the copy with its source: types, permission bits, symlink targets,
+    # sizes and, in parallel, the hashed contents of every file. Returns the first
+    # max_differences problems as "path: problem" strings (empty if the copy matches).
+    differences = []
+    pending = []
+    compare_trees(test_case['source_directory'], test_case['destination_directory'],
+                  test_case['copy_symlinks'], differences, pending)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        matches = executor.map(lambda files: same_contents(files[1], files[2]), pending)
+        differences += [(path, "contents differ") for (path, _, _), match in zip(pending, matches) if not match]
+    return [f"{path}: {problem}" for path, problem in sorted(differences)[:max_differences]]
+
+def remove_scratch_dir(path):
+    # The copy is made by copytree running under sudo, so it may hold entries we
+    # cannot remove ourselves; those are removed with sudo as well. Returns False
+    # if the directory is still there.
+    shutil.rmtree(path, ignore_errors=True)
+    if os.path.lexists(path):
+        subprocess.run(["sudo", "rm", "-rf", "--", path])
+    return not os.path.lexists(path)
+
+def run_test_case(test_case, test_number, timeout=TEST_TIMEOUT):
+    # Runs the test case under its own scratch directory, so its source and
+    # destination directories cannot clash with those of other test cases.
+    # Returns the result and the resource usage of the copytree run.
+    scratch_dir = tempfile.mkdtemp(prefix=f"part4_test_{test_number}_")
     try:
-        with open('test_cases.json', 'r') as f:
-            test_cases = json.load(f)
-
-        compile_c_files()
-
-        results = []
-        for i, test_case in enumerate(test_cases, 1):
-            if os.path.exists(test_case['source_directory']):
-                shutil.rmtree(test_case['source_directory'])
-            if os.path.exists(test_case['destination_directory']):
-                shutil.rmtree(test_case['destination_directory'])
-
-            run_test_case(test_case)
-            result = {
-                "test_name": test_case['description'],
-                "test_number": i,
-                "status": "PASSED" if verify_test_result(test_case) else "FAILED"
-            }
-            results.append(result)
-
-        signal.alarm(0)  # Disable the alarm
-
-        # Write results to part4_output.txt
-        with open('part4_output.txt', 'w') as f:
-            for result in results:
-                f.write(f"TEST_{result['test_number']}, {result['status']}\n")
-
-        return json.dumps(results, indent=4)
-
-    except TimeoutException:
-        # Return failure for all tests if the timeout is reached
-        results = []
-        for i, test_case in enumerate(test_cases, 1):
-            results.append({
-                "test_name": test_case['description'],
-                "test_number": i,
-                "status": "FAILED"
-            })
-
-        # Write results to part4_output.txt
-        with open('part4_output.txt', 'w') as f:
-            for result in results:
-                f.write(f"TEST_{result['test_number']}, {result['status']}\n")
-
-        return json.dumps(results, indent=4)
+        test_case = dict(test_case,
+                         source_directory=os.path.join(scratch_dir, test_case['source_directory']),
+                         destination_directory=os.path.join(scratch_dir, test_case['destination_directory']))
+        setup_test_environment(test_case)
+        try:
+            usage = run_copytree(test_case, timeout)
+            differences = verify_test_result(test_case)
+        except subprocess.TimeoutExpired as error:
+            usage = error.usage
+            differences = [f"copytree did not finish within {timeout} seconds"]
+        except subprocess.CalledProcessError as error:
+            usage = error.usage
+            differences = [f"copytree exited with status {error.returncode}"]
+    finally:
+        if not remove_scratch_dir(scratch_dir):
+            print(f"TEST_{test_number}: could not remove {scratch_dir}", file=sys.stderr)
+
+    result = {
+        "test_name": test_case['description'],
+        "test_number": test_number,
+        "status": "FAILED" if differences else "PASSED",
+        "differences": differences
+    }
+    return result, usage
+
+def run_tests(jobs=DEFAULT_JOBS, timeout=TEST_TIMEOUT):
+    # Runs up to `jobs` test cases at the same time, each with its own timeout
+    with open('test_cases.json', 'r') as f:
+        test_cases = json.load(f)
+
+    if not sudo_without_password():
+        print("part4_tests.py runs copytree through sudo away from the terminal, so sudo must not "
+              "ask for a password (a NOPASSWD rule, or root)", file=sys.stderr)
+        sys.exit(1)
+    compile_c_files()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_test_case, test_case, i, timeout)
+                   for i, test_case in enumerate(test_cases, 1)]
+        outcomes = [future.result() for future in futures]
+
+    results = [result for result, _ in outcomes]
+    resources = [{"test": f"TEST_{result['test_number']}", "status": result['status'], **usage}
+                 for result, usage in outcomes]
+    for result in results:
+        for difference in result['differences']:
+            print(f"TEST_{result['test_number']}: {difference}")
+
+    # Write results to part4_output.txt
+    with open('part4_output.txt', 'w') as f:
+        for result in results:
+            f.write(f"TEST_{result['test_number']}, {result['status']}\n")
+    write_resources('part4_resources.csv', resources)
+
+    return json.dumps(results, indent=4)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile copytree and run the test cases of test_cases.json.")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of test cases run at the same time (default: {DEFAULT_JOBS})")
+    parser.add_argument("--timeout", type=float, default=TEST_TIMEOUT,
+                        help=f"seconds each test case may run (default: {TEST_TIMEOUT})")
+    return parser.parse_args()
 
 def main():
-    run_tests()
+    args = parse_args()
+    run_tests(args.jobs, args.timeout)
 
 if __name__ == "__main__":
     main()
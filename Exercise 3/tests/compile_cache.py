@@ -0,0 +1,171 @@
+import os
+import sys
+import glob
+import shlex
+import shutil
+import hashlib
+import tempfile
+import argparse
+import functools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Binaries are cached in COMPILE_CACHE_DIR, or in ~/.cache/os-exercises/compile
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "os-exercises", "compile")
+
+# Number of submissions built at the same time by the command line
+DEFAULT_JOBS = os.cpu_count() or 1
+
+# What each harness builds: the gcc sources and binary, or the make target
+PRESETS = {
+    "part2": {"sources": ["part2.c"], "output": "part2"},
+    "part4": {"sources": ["part4.c", "copytree.c"], "output": "copytree"},
+    "ex3": {"make": True, "output": "ex3.out"},
+}
+
+# Files make may read besides the Makefile
+MAKE_INPUTS = ["*.c", "*.h"]
+
+# Environment variables that change what the compiler or make builds, part of every key
+BUILD_ENV = ["CC", "CFLAGS", "CPPFLAGS", "LDFLAGS", "LDLIBS", "CPATH", "C_INCLUDE_PATH", "LIBRARY_PATH"]
+
+def cache_dir():
+    return os.environ.get("COMPILE_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool):
+    # Where the tool resolves to and the first line of `tool --version`, part of
+    # every key built with the tool, so a different or upgraded compiler misses
+    try:
+        result = subprocess.run([tool, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return ""
+    version = result.stdout.decode(errors="replace").split("\n")[0]
+    return f"{shutil.which(tool)} {version}"
+
+def build_key(command, input_files, tools, cwd="."):
+    # Hash of the build command (compiler and flags), the build environment, the
+    # versions of the tools it runs, and the names (relative to cwd) and contents
+    # of its input files
+    digest = hashlib.sha256()
+    environment = [f"{name}={os.environ.get(name, '')}" for name in BUILD_ENV]
+    for part in list(command) + environment + [tool_version(tool) for tool in tools]:
+        digest.update(part.encode() + b"\0")
+    for path in sorted(set(input_files)):
+        digest.update(path.encode() + b"\0")
+        with open(os.path.join(cwd, path), 'rb') as file:
+            digest.update(file.read())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def dependencies(compiler, sources, flags, cwd="."):
+    # Every file the preprocessor reads for sources, system headers included, as
+    # listed by `compiler -M`. None if the listing fails (the build will too).
+    try:
+        result = subprocess.run(compiler + ["-M"] + list(flags) + list(sources), cwd=cwd,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    rules = result.stdout.decode(errors="replace").replace("\\\n", " ")
+    return [path for rule in rules.splitlines() for path in shlex.split(rule) if not path.endswith(":")]
+
+def replace_with_copy(source, destination):
+    # Copy source over destination through a temporary file of its own, so no
+    # one sees a partial file and concurrent copies (build_all's threads share a
+    # pid) never write to the same temporary file
+    fd, temp = tempfile.mkstemp(prefix=f"{os.path.basename(destination)}.", suffix=".tmp",
+                                dir=os.path.dirname(destination) or ".")
+    os.close(fd)
+    try:
+        shutil.copy2(source, temp)
+        os.replace(temp, destination)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+def store(key, binary):
+    # Save a built binary under key. Failed builds are not stored, so a broken
+    # environment or an interrupted compile never sticks to the sources.
+    os.makedirs(cache_dir(), exist_ok=True)
+    replace_with_copy(binary, os.path.join(cache_dir(), key))
+
+def lookup(key, output):
+    # Copy a cached binary to output. Returns True on a hit.
+    entry = os.path.join(cache_dir(), key)
+    if not os.path.isfile(entry):
+        return False
+    replace_with_copy(entry, output)
+    return True
+
+def compile_cached(sources, output, flags=(), compiler=("gcc",), cwd="."):
+    # Same as running `compiler sources flags -o output` in cwd, but the binary is
+    # taken from the cache when the sources, every header they include, the flags
+    # and the compiler match an earlier successful build. Returns True if output was built.
+    compiler = list(compiler)
+    if not all(os.path.isfile(os.path.join(cwd, source)) for source in sources):
+        return False
+
+    inputs = dependencies(compiler, sources, flags, cwd)
+    key = build_key(compiler + list(sources) + list(flags), inputs, compiler[-1:], cwd) if inputs else None
+    if key and lookup(key, os.path.join(cwd, output)):
+        return True
+
+    result = subprocess.run(compiler + list(sources) + list(flags) + ["-o", output], cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    built = result.returncode == 0 and os.path.isfile(os.path.join(cwd, output))
+    if built and key:
+        store(key, os.path.join(cwd, output))
+    return built
+
+def make_cached(output, cwd="."):
+    # Same as running `make` in cwd to build output, keyed by the Makefile, the
+    # .c/.h files next to it, the system headers the .c files include and the make
+    # and cc versions. Returns True if output was built.
+    makefiles = [name for name in ["GNUmakefile", "makefile", "Makefile"] if os.path.isfile(os.path.join(cwd, name))]
+    if not makefiles or not shutil.which("make"):
+        return False
+
+    compiler = shlex.split(os.environ.get("CC", "cc"))
+    sources = [os.path.relpath(path, cwd) for pattern in MAKE_INPUTS for path in glob.glob(os.path.join(cwd, pattern))]
+    c_files = [source for source in sources if source.endswith(".c")]
+    headers = dependencies(compiler, c_files, shlex.split(os.environ.get("CPPFLAGS", "")), cwd) if c_files else []
+    key = build_key(["make", output], makefiles + sources + headers, ["make", compiler[0]], cwd) \
+        if headers is not None else None
+    if key and lookup(key, os.path.join(cwd, output)):
+        return True
+
+    result = subprocess.run(["make"], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    built = result.returncode == 0 and os.path.isfile(os.path.join(cwd, output))
+    if built and key:
+        store(key, os.path.join(cwd, output))
+    return built
+
+def build_preset(preset, cwd="."):
+    spec = PRESETS[preset]
+    if spec.get("make"):
+        return make_cached(spec["output"], cwd)
+    return compile_cached(spec["sources"], spec["output"], cwd=cwd)
+
+def build_all(preset, directories, jobs=DEFAULT_JOBS):
+    # Build the preset in every submission directory, `jobs` at a time.
+    # Returns {directory: built}.
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(directories, executor.map(lambda directory: build_preset(preset, directory), directories)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build submissions through the shared compile cache, several at a time.")
+    parser.add_argument("preset", choices=sorted(PRESETS), help="what to build in each directory")
+    parser.add_argument("directories", nargs="+", help="submission directories")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"number of submissions built at the same time (default: {DEFAULT_JOBS})")
+    args = parser.parse_args()
+
+    results = build_all(args.preset, args.directories, args.jobs)
+    for directory, built in results.items():
+        print(f"{directory}: {'built' if built else 'FAILED'}")
+    sys.exit(0 if all(results.values()) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import os
+import csv
+import sys
+import time
+import atexit
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
+
+# Seconds to wait for a killed process group to be gone
+KILL_TIMEOUT = 5
+
+# Columns of the per-test resource breakdown
+RESOURCE_COLUMNS = ["test", "status", "wall_s", "user_s", "sys_s", "max_rss_kb"]
+
+# Linux carries a process's peak RSS across exec, so a program started straight
+# from this Python process never reports a max_rss_kb below the interpreter's
+# (~18 MB). Commands are therefore started through this wrapper: once exec'd its
+# address space is tiny, and it forks and execs the command, waits for it and
+# writes the command's own ru_maxrss (in KB) to the report file.
+WRAPPER_SOURCE = r"""
+#include <errno.h>
+#include <stdio.h>
+#include <signal.h>
+#include <unistd.h>
+#include <sys/wait.h>
+#include <sys/resource.h>
+
+int main(int argc, char *argv[]) {
+    if (argc < 3) {
+        fprintf(stderr, "usage: %s REPORT COMMAND [ARG]...\n", argv[0]);
+        return 127;
+    }
+    pid_t pid = fork();
+    if (pid < 0) {
+        perror("fork");
+        return 127;
+    }
+    if (pid == 0) {
+        execvp(argv[2], argv + 2);
+        perror(argv[2]);
+        _exit(127);
+    }
+
+    int status;
+    struct rusage usage;
+    while (wait4(pid, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return 127;
+        }
+    }
+    FILE *report = fopen(argv[1], "w");
+    if (report) {
+        fprintf(report, "%ld\n", usage.ru_maxrss);
+        fclose(report);
+    }
+
+    // Exit the way the command did, so the caller sees the same status
+    if (WIFSIGNALED(status)) {
+        signal(WTERMSIG(status), SIG_DFL);
+        raise(WTERMSIG(status));
+        return 128 + WTERMSIG(status);
+    }
+    return WEXITSTATUS(status);
+}
+"""
+
+wrapper_lock = threading.Lock()
+wrapper_path = []
+
+def build_wrapper():
+    # Compile the wrapper into a directory removed at exit. Returns its path, or
+    # None if it cannot be built (then max_rss_kb includes the interpreter's RSS).
+    build_dir = tempfile.mkdtemp(prefix="rusage_wrapper_")
+    atexit.register(shutil.rmtree, build_dir, True)
+    with open(os.path.join(build_dir, "rusage_wrapper.c"), 'w') as file:
+        file.write(WRAPPER_SOURCE)
+    if compile_cache is not None:
+        built = compile_cache.compile_cached(["rusage_wrapper.c"], "rusage_wrapper", ["-O2"], cwd=build_dir)
+    else:
+        try:
+            built = subprocess.run(["gcc", "rusage_wrapper.c", "-O2", "-o", "rusage_wrapper"], cwd=build_dir,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        except OSError:
+            built = False
+    return os.path.join(build_dir, "rusage_wrapper") if built else None
+
+def rusage_wrapper():
+    # The wrapper, built the first time any thread asks for it
+    with wrapper_lock:
+        if not wrapper_path:
+            wrapper_path.append(build_wrapper())
+        return wrapper_path[0]
+
+def wrap_command(args, report_path):
+    # args run through the wrapper, reporting to report_path, if it could be built
+    wrapper = rusage_wrapper()
+    return [wrapper, report_path] + list(args) if wrapper else list(args)
+
+def reported_max_rss(report_path, fallback):
+    # The command's peak RSS written by the wrapper. Without a report (no wrapper)
+    # it is the wait4 value; if the wrapper was killed before the command finished
+    # (a timeout) the command's own peak is unknown and left blank.
+    if not rusage_wrapper():
+        return fallback
+    try:
+        with open(report_path, 'r') as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return ""
+
+def group_members(pgid):
+    # Pids of the live (not zombie) processes of the group, from /proc
+    members = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat", 'r') as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # state, ppid, pgrp
+        if fields[0] != "Z" and int(fields[2]) == pgid:
+            members.append(int(pid))
+    return members
+
+def kill_process_group(pgid, sudo=False):
+    # Kill every process of the group and wait for the group to be gone. With
+    # sudo the group holds processes running as root, which only sudo can kill:
+    # killpg succeeds as soon as it signals any member we own (the wrapper), so
+    # it cannot tell us whether they were reached, and sudo is always used.
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    if sudo:
+        subprocess.run(["sudo", "-n", "kill", "-KILL", "--", f"-{pgid}"], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + KILL_TIMEOUT
+    while group_members(pgid):
+        if time.monotonic() > deadline:
+            print(f"Processes {group_members(pgid)} of group {pgid} survived SIGKILL", file=sys.stderr)
+            return False
+        time.sleep(0.01)
+    return True
+
+def run_measured(args, timeout=None, check=False, capture_output=True, **kwargs):
+    # Like subprocess.run, but also returns the resource usage of the child. It is
+    # reaped with wait4, whose rusage covers the child and every process it waited
+    # for; max_rss_kb is the command's own peak, measured through the wrapper above.
+    # Output goes through temporary files, so a leftover grandchild holding a pipe
+    # open cannot block us.
+    # The TimeoutExpired or CalledProcessError raised carries the usage as `usage`.
+    # The child runs in its own process group, which is killed once the child is
+    # done, so processes it forked cannot outlive the test. A command starting with
+    # sudo has its group killed through sudo. It runs in a session of its own,
+    # away from the terminal, so sudo must not need a password (NOPASSWD).
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr, \
+            tempfile.NamedTemporaryFile(prefix="rusage_") as report:
+        streams = {"stdout": stdout, "stderr": stderr} if capture_output else {}
+        command = wrap_command(args, report.name)
+        start = time.perf_counter()
+        process = subprocess.Popen(command, start_new_session=True, **streams, **kwargs)
+        waited = []
+        reaper = threading.Thread(target=lambda: waited.append(os.wait4(process.pid, 0)), daemon=True)
+        reaper.start()
+        try:
+            reaper.join(timeout)
+        finally:
+            timed_out = reaper.is_alive()
+            kill_process_group(process.pid, sudo=os.path.basename(args[0]) == "sudo")
+        reaper.join()
+
+        _, status, rusage = waited[0]
+        process.returncode = os.waitstatus_to_exitcode(status)
+        usage = {"wall_s": round(time.perf_counter() - start, 3), "user_s": round(rusage.ru_utime, 3),
+                 "sys_s": round(rusage.ru_stime, 3), "max_rss_kb": reported_max_rss(report.name, rusage.ru_maxrss)}
+        output = [None, None]
+        if capture_output:
+            for i, stream in enumerate([stdout, stderr]):
+                stream.seek(0)
+                output[i] = stream.read()
+
+    if timed_out:
+        error = subprocess.TimeoutExpired(args, timeout, *output)
+    elif check and process.returncode != 0:
+        error = subprocess.CalledProcessError(process.returncode, args, *output)
+    else:
+        return subprocess.CompletedProcess(args, process.returncode, *output), usage
+    error.usage = usage
+    raise error
+
+def write_resources(resources_file, rows):
+    # One row per test: its name, status and the usage returned by run_measured
+    with open(resources_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESOURCE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -1,7 +1,20 @@
 import subprocess
 import os
+import pty
 import time
+import select
 import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import compile_cache
+except ImportError:
+    # Compile directly when the harness is used without compile_cache.py
+    compile_cache = None
+
+from measure import kill_process_group, reported_max_rss, wrap_command, write_resources
 
 # Constants
 CONFIGS = {
@@ -10,8 +23,90 @@ CONFIGS = {
     "config3": 15,
     "config4": 251
 }  # Configuration names and their expected line counts
-TIMEOUT = 300  # 5 minutes timeout in seconds
+TIMEOUT = 300  # 5 minutes timeout in seconds, for configs that keep making progress
+EDITOR_DELAY = 0.1  # Seconds a co-editor spends on every message
+STALL_DELAYS = 20  # Co-editor delays without a new Producer line before a run is declared deadlocked
+MIN_STALL = 5.0  # Shortest deadlock bound in seconds, so a slow or busy machine is not taken for a deadlock
+JOBS = min(len(CONFIGS), os.cpu_count() or 1)  # Configs run at the same time, at most one per CPU
 OUTPUT_FILE = "test3_output.txt"
+RESOURCES_FILE = "test3_resources.csv"  # Wall time, CPU time and peak RSS of every config run
+
+def stall_bound(config):
+    # Seconds without a new Producer line after which a run counts as deadlocked:
+    # while messages flow a co-editor prints at least one every EDITOR_DELAY, so
+    # allow STALL_DELAYS of those plus one per producer queue the dispatcher scans,
+    # but never less than MIN_STALL
+    with open(config, 'r') as f:
+        producers = sum(1 for line in f if line.startswith("PRODUCER"))
+    return max(MIN_STALL, (STALL_DELAYS + producers) * EDITOR_DELAY)
+
+def run_streamed(args, stall_timeout, timeout=TIMEOUT):
+    # Run the program with stdout on a pseudo-terminal, so stdio flushes every line
+    # as it is printed, and watch the lines as they arrive. The run is declared
+    # deadlocked once stall_timeout seconds pass without a new Producer line (or
+    # after timeout seconds in all), and its process group is then killed.
+    # Returns the exit code, the output, whether it deadlocked and the resource
+    # usage of the run, from wait4, with the program's own peak RSS measured through
+    # measure.py's wrapper.
+    report = tempfile.NamedTemporaryFile(prefix="rusage_")
+    command = wrap_command(args, report.name)
+    start = time.perf_counter()
+    master, slave = pty.openpty()
+    process = subprocess.Popen(command, stdout=slave, stderr=subprocess.DEVNULL, start_new_session=True)
+    os.close(slave)
+    waited = []
+    reaper = threading.Thread(target=lambda: waited.append(os.wait4(process.pid, 0)), daemon=True)
+    reaper.start()
+
+    lines = []
+    pending = b""
+    last_progress = start
+    deadlocked = False
+    try:
+        while True:
+            wait = min(last_progress + stall_timeout, start + timeout) - time.perf_counter()
+            if wait <= 0:
+                deadlocked = True
+                break
+            ready, _, _ = select.select([master], [], [], wait)
+            if not ready:
+                continue
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                # EIO: every process holding the terminal has exited
+                break
+            if not data:
+                break
+            *complete, pending = (pending + data).split(b"\n")
+            for line in complete:
+                lines.append(line.rstrip(b"\r").decode(errors="replace"))
+                if lines[-1].startswith("Producer"):
+                    last_progress = time.perf_counter()
+        if not deadlocked:
+            reaper.join(max(start + timeout - time.perf_counter(), 0))
+            deadlocked = reaper.is_alive()
+    finally:
+        kill_process_group(process.pid)
+        reaper.join()
+        os.close(master)
+
+    if pending:
+        lines.append(pending.rstrip(b"\r").decode(errors="replace"))
+    _, status, rusage = waited[0]
+    with report:
+        max_rss = reported_max_rss(report.name, rusage.ru_maxrss)
+    usage = {"wall_s": round(time.perf_counter() - start, 3), "user_s": round(rusage.ru_utime, 3),
+             "sys_s": round(rusage.ru_stime, 3), "max_rss_kb": max_rss}
+    output_text = "".join(line + "\n" for line in lines)
+    return os.waitstatus_to_exitcode(status), output_text, deadlocked, usage
+
+def run_config(config):
+    # Run one config and save its output to <config>_output.txt
+    _, output_text, deadlocked, usage = run_streamed(["./ex3.out", f"./{config}"], stall_bound(config))
+    with open(f"{config}_output.txt", 'w') as f:
+        f.write(output_text)
+    return output_text, deadlocked, usage
 
 # Function to check the order of production
 def check_order(filename):
@@ -34,6 +129,8 @@ def check_order(filename):
 
 # Function to compile the program using Makefile
 def compile_program():
+    if compile_cache is not None:
+        return compile_cache.make_cached("ex3.out")
     if not shutil.which("make"):
         return False
     result = subprocess.run(["make"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -49,57 +146,44 @@ def main():
             return
 
         total_score = 100
+        resources = []
+
+        # Up to JOBS configs run at the same time; their results are scored in order
+        with ThreadPoolExecutor(max_workers=JOBS) as executor:
+            runs = dict(zip(CONFIGS, executor.map(run_config, CONFIGS)))
 
         for config, expected_lines in CONFIGS.items():
             config_output_file = f"{config}_output.txt"
-            
-            # Run the program with the configuration file with a timeout to prevent deadlock
-            try:
-                start_time = time.time()
-                result = subprocess.run(["./ex3.out", f"./{config}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=TIMEOUT)
-                elapsed_time = time.time() - start_time
-                output_text = result.stdout.decode()
-                exit_status = result.returncode
-
-                # Write the output to the specific config output file
-                with open(config_output_file, 'w') as f:
-                    f.write(output_text)
-
-                # Check if the program entered a deadlock
-                if elapsed_time >= TIMEOUT:
-                    output.write(f"TEST_CONFIG_{config} FAILED: Program entered a deadlock.\n")
-                    total_score = 0
-                    break
-
-                # Verify the output
-                actual_lines = output_text.strip().split('\n')
-                num_producers = len(set([int(line.split()[1]) for line in actual_lines if line.startswith("Producer")]))
-                errors = []
-
-                if len(actual_lines) != expected_lines:
-                    errors.append(f"Expected {expected_lines} lines, got {len(actual_lines)}")
-                    total_score -= 15
-                if "DONE" not in actual_lines[-1]:
-                    errors.append("Missing DONE at the end")
-                    total_score -= 15
-                if not check_order(config_output_file):
-                    errors.append("Incorrect order of production")
-                    total_score -= 15
-
-                if errors:
-                    for error in errors:
-                        output.write(f"TEST_CONFIG_{config} FAILED: {error}\n")
-                else:
-                    output.write(f"TEST_CONFIG_{config} PASSED\n")
-
-            except subprocess.TimeoutExpired:
+            output_text, deadlocked, usage = runs[config]
+
+            # Check if the program entered a deadlock
+            if deadlocked:
                 output.write(f"TEST_CONFIG_{config} FAILED: Program entered a deadlock.\n")
+                resources.append({"test": config, "status": "DEADLOCK", **usage})
                 total_score = 0
                 break
-            except subprocess.CalledProcessError:
-                output.write(f"TEST_CONFIG_{config} FAILED: Compilation error or runtime error.\n")
-                total_score = 0
-                break
+
+            # Verify the output
+            actual_lines = output_text.strip().split('\n')
+            num_producers = len(set([int(line.split()[1]) for line in actual_lines if line.startswith("Producer")]))
+            errors = []
+
+            if len(actual_lines) != expected_lines:
+                errors.append(f"Expected {expected_lines} lines, got {len(actual_lines)}")
+                total_score -= 15
+            if "DONE" not in actual_lines[-1]:
+                errors.append("Missing DONE at the end")
+                total_score -= 15
+            if not check_order(config_output_file):
+                errors.append("Incorrect order of production")
+                total_score -= 15
+
+            if errors:
+                for error in errors:
+                    output.write(f"TEST_CONFIG_{config} FAILED: {error}\n")
+            else:
+                output.write(f"TEST_CONFIG_{config} PASSED\n")
+            resources.append({"test": config, "status": "FAILED" if errors else "PASSED", **usage})
 
         if total_score != 0:
             total_score = max(total_score, 0)  # Ensure the total score is not negative
@@ -108,6 +192,7 @@ def main():
 
         # Write the total score to the output file
         output.write(f"Total score: {total_score}\n")
+        write_resources(RESOURCES_FILE, resources)
 
 if __name__ == "__main__":
     main()